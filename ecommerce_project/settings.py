@@ -168,4 +168,10 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 # EMAIL_PORT = env('EMAIL_PORT', int)
 # EMAIL_USE_TLS = env('EMAIL_USE_TLS', bool)
 # EMAIL_HOST_USER = env('EMAIL_HOST_USER')
-# EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD')
\ No newline at end of file
+# EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD')
+# Product search backend: 'auto', 'fts5', 'postgres', 'memory' or 'like' (see store/search.py)
+STORE_SEARCH_BACKEND = 'auto'
+# Cart storage: 'database', or 'cache' to keep anonymous carts out of the
+# database until login. 'cache' needs a cache shared by all server processes,
+# such as Redis (see store/carts.py)
+STORE_CART_BACKEND = 'database'
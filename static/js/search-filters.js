@@ -6,7 +6,21 @@ document.addEventListener('DOMContentLoaded', function() {
             const field = this.dataset.field;
             const value = this.dataset.value;
             
-            if (field) {
+            if (field === 'price') {
+                // Price buckets fill in the min/max price inputs
+                const minInput = document.querySelector('input[name="min_price"]');
+                const maxInput = document.querySelector('input[name="max_price"]');
+                const wasActive = this.classList.contains('active');
+                document.querySelectorAll('.price-bucket').forEach(bucket => bucket.classList.remove('active'));
+                if (wasActive) {
+                    minInput.value = '';
+                    maxInput.value = '';
+                } else {
+                    this.classList.add('active');
+                    minInput.value = this.dataset.min;
+                    maxInput.value = this.dataset.max;
+                }
+            } else if (field) {
                 // For options with a specific field (like in_stock, featured)
                 const input = document.getElementById(`${field}-input`);
                 if (input) {
@@ -67,4 +81,101 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         });
     });
-});
\ No newline at end of file
+    
+    // Typeahead suggestions while typing in a search box
+    document.querySelectorAll('input[name="q"][data-suggest-url]').forEach(initSearchSuggest);
+});
+
+function initSearchSuggest(input) {
+    const menu = document.createElement('div');
+    menu.className = 'search-suggest-menu list-group';
+    menu.hidden = true;
+    input.parentElement.appendChild(menu);
+    input.setAttribute('autocomplete', 'off');
+    
+    let timer = null;
+    let controller = null;
+    let active = -1;
+    
+    function close() {
+        menu.hidden = true;
+        menu.innerHTML = '';
+        active = -1;
+    }
+    
+    function highlight(index) {
+        const items = menu.querySelectorAll('.list-group-item');
+        items.forEach((item, i) => item.classList.toggle('active', i === index));
+        active = index;
+    }
+    
+    function render(suggestions) {
+        menu.innerHTML = '';
+        suggestions.forEach(suggestion => {
+            const item = document.createElement('a');
+            item.className = 'list-group-item list-group-item-action';
+            item.href = suggestion.url;
+            
+            const icon = document.createElement('i');
+            icon.className = suggestion.type === 'category' ? 'fas fa-folder me-2' : 'fas fa-box me-2';
+            item.appendChild(icon);
+            item.appendChild(document.createTextNode(suggestion.label));
+            menu.appendChild(item);
+        });
+        menu.hidden = suggestions.length === 0;
+        active = -1;
+    }
+    
+    function fetchSuggestions() {
+        const query = input.value.trim();
+        if (query.length < 2) {
+            close();
+            return;
+        }
+        
+        // Only the latest keystroke's request matters
+        if (controller) {
+            controller.abort();
+        }
+        controller = new AbortController();
+        
+        const url = `${input.dataset.suggestUrl}?q=${encodeURIComponent(query)}`;
+        fetch(url, { signal: controller.signal })
+            .then(response => response.ok ? response.json() : { suggestions: [] })
+            .then(data => render(data.suggestions || []))
+            .catch(error => {
+                if (error.name !== 'AbortError') {
+                    close();
+                }
+            });
+    }
+    
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        timer = setTimeout(fetchSuggestions, 150);
+    });
+    
+    input.addEventListener('keydown', function(event) {
+        const items = menu.querySelectorAll('.list-group-item');
+        if (menu.hidden || items.length === 0) {
+            return;
+        }
+        if (event.key === 'ArrowDown') {
+            event.preventDefault();
+            highlight((active + 1) % items.length);
+        } else if (event.key === 'ArrowUp') {
+            event.preventDefault();
+            highlight((active - 1 + items.length) % items.length);
+        } else if (event.key === 'Enter' && active >= 0) {
+            event.preventDefault();
+            window.location.href = items[active].href;
+        } else if (event.key === 'Escape') {
+            close();
+        }
+    });
+    
+    // Delay so a click on a suggestion lands before the menu disappears
+    input.addEventListener('blur', function() {
+        setTimeout(close, 150);
+    });
+}
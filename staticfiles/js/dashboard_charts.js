@@ -674,9 +674,43 @@ function animateStatCounters() {
     });
 }
 
+/**
+ * Fetch the chart data from the element carrying a data-chart-url attribute.
+ * The endpoint sends ETag/Last-Modified, so the browser revalidates its cached
+ * copy and only downloads the payload again when the data changed.
+ * @returns {Promise} Resolves once the chart data (if any) is on window
+ */
+function loadDashboardChartData() {
+    const container = document.querySelector('[data-chart-url]');
+    if (!container) return Promise.resolve();
+    
+    return fetch(container.dataset.chartUrl, {
+        credentials: 'same-origin',
+        headers: { 'Accept': 'application/json' }
+    })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`Unexpected response status ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(chartData => {
+            window.salesTrendData = chartData.salesTrendData;
+            window.categoryData = chartData.categoryData;
+            window.orderStatusData = chartData.orderStatusData;
+            window.comparisonData = chartData.comparisonData;
+            window.topProductsData = chartData.topProductsData;
+            window.userRegistrationData = chartData.userRegistrationData;
+        })
+        .catch(error => {
+            // Charts fall back to their default (empty) data
+            console.error('Could not load dashboard chart data:', error);
+        });
+}
+
 /**
  * Initialize dashboard analytics when the DOM is loaded
  */
 document.addEventListener('DOMContentLoaded', () => {
-    initDashboardAnalytics();
+    loadDashboardChartData().then(initDashboardAnalytics);
 });
\ No newline at end of file
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Product, Cart, CartItem, Order, OrderItem, UserProfile, Wishlist
+from .models import Category, Product, Cart, CartItem, Order, OrderItem, UserProfile, Wishlist, DailySalesRollup, SearchLog
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -29,6 +29,7 @@ class CartItemAdmin(admin.ModelAdmin):
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
+    raw_id_fields = ('product', 'category')
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
@@ -40,6 +41,20 @@ class OrderAdmin(admin.ModelAdmin):
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
     list_display = ('product_name', 'order', 'quantity', 'subtotal')
+    raw_id_fields = ('order', 'product', 'category')
+
+@admin.register(DailySalesRollup)
+class DailySalesRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'status', 'product_name', 'category', 'revenue', 'units', 'order_count')
+    list_filter = ('status', 'date')
+    search_fields = ('product_name',)
+
+@admin.register(SearchLog)
+class SearchLogAdmin(admin.ModelAdmin):
+    list_display = ('query', 'result_count', 'fuzzy', 'latency_ms', 'created_at')
+    list_filter = ('fuzzy', 'created_at')
+    search_fields = ('query',)
+    date_hierarchy = 'created_at'
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
@@ -0,0 +1,470 @@
+"""
+Aggregations behind the staff dashboard charts and the admin reports.
+
+Sales figures are read from the DailySalesRollup table (see store.rollups)
+with grouped SUM/COUNT queries, so their cost grows with the number of days
+covered rather than with the number of orders.
+"""
+import datetime
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Avg, Count, DateField, Max, Q, Sum
+from django.db.models.functions import Coalesce, Trunc
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Category, DailySalesRollup, Order, SearchLog
+from .rollups import ITEM_NAME_KEY, day_bounds
+
+CATEGORY_COLORS = [
+    '#6c63ff', '#ff6b6b', '#36e2a8', '#ffcf5c', '#4dc9ff',
+    '#b266ff', '#05dfd7', '#fb8c34', '#ff66c4'
+]
+STATUS_COLORS = ['#ffcf5c', '#6c63ff', '#4dc9ff', '#36e2a8', '#ff6b6b']
+TOP_PRODUCT_COLORS = ['#6c63ff', '#36e2a8', '#4dc9ff', '#b266ff', '#ffcf5c']
+
+GRANULARITIES = ('day', 'week', 'month')
+DEFAULT_GRANULARITY = 'month'
+# Upper bound on the number of points in a series, keeps any range cheap
+MAX_CHART_BUCKETS = 366
+
+# The chart payload is recomputed at most once per bucket
+CHART_CACHE_KEY = 'store:dashboard:chart_data'
+CHART_CACHE_LOCK_KEY = 'store:dashboard:chart_data:lock'
+CHART_CACHE_GENERATION_KEY = 'store:dashboard:chart_data:generation'
+CHART_DATA_CHANGED_KEY = 'store:dashboard:chart_data:changed'
+CHART_CACHE_BUCKET = 5 * 60
+CHART_CACHE_TIMEOUT = 24 * 60 * 60
+CHART_CACHE_LOCK_TIMEOUT = 60
+
+# Rollup rows grouped per product are labelled with the product's current
+# name, or the name it was sold under once the product is deleted
+PRODUCT_LABEL = Coalesce(Max('product__name'), Max('product_name'))
+
+SEARCH_REPORT_DAYS = 30
+SEARCH_REPORT_ROWS = 20
+
+
+class ChartRange:
+    """The dates in [start, end] split into day, week or month buckets"""
+
+    def __init__(self, start, end, granularity=DEFAULT_GRANULARITY, max_buckets=MAX_CHART_BUCKETS):
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Granularity must be one of: {', '.join(GRANULARITIES)}")
+        if start > end:
+            raise ValueError('The start date must not be after the end date')
+
+        self.start = start
+        self.end = end
+        self.granularity = granularity
+
+        self.buckets = []
+        current = self.bucket_start(start)
+        while current <= end:
+            self.buckets.append(current)
+            if len(self.buckets) > max_buckets:
+                raise ValueError('Range too long for this granularity, choose a shorter range or a coarser granularity')
+            current = self.next_bucket(current)
+
+    @classmethod
+    def from_params(cls, params, today=None):
+        """Build a range from start/end/granularity query parameters"""
+        today = today or timezone.localdate()
+        granularity = params.get('granularity') or DEFAULT_GRANULARITY
+        end = parse_date(params.get('end') or '') or today
+        start = parse_date(params.get('start') or '')
+        if start is None:
+            # Default to the last 12 months, including the current one
+            start = end.replace(day=1)
+            for _ in range(11):
+                start = (start - datetime.timedelta(days=1)).replace(day=1)
+        return cls(start, end, granularity)
+
+    def bucket_start(self, day):
+        if self.granularity == 'week':
+            return day - datetime.timedelta(days=day.weekday())
+        if self.granularity == 'month':
+            return day.replace(day=1)
+        return day
+
+    def next_bucket(self, day):
+        if self.granularity == 'week':
+            return day + datetime.timedelta(days=7)
+        if self.granularity == 'month':
+            return (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+        return day + datetime.timedelta(days=1)
+
+    def label(self, day):
+        if self.granularity == 'month':
+            return day.strftime('%b %Y')
+        return day.strftime('%b %d')
+
+    @property
+    def labels(self):
+        return [self.label(day) for day in self.buckets]
+
+    def previous(self):
+        """The range of equal length right before this one"""
+        length = self.end - self.start + datetime.timedelta(days=1)
+        # Bucket alignment may add one bucket to a range of the same length
+        return ChartRange(
+            self.start - length,
+            self.start - datetime.timedelta(days=1),
+            self.granularity,
+            max_buckets=len(self.buckets) + 1,
+        )
+
+    def truncate(self, field):
+        return Trunc(field, self.granularity, output_field=DateField())
+
+    @property
+    def cache_key(self):
+        return f'{self.start.isoformat()}:{self.end.isoformat()}:{self.granularity}'
+
+
+def sales_series(chart_range):
+    """Total order value per bucket of the range"""
+    rows = (
+        DailySalesRollup.objects.order_totals()
+        .filter(date__gte=chart_range.start, date__lte=chart_range.end)
+        .annotate(bucket=chart_range.truncate('date'))
+        .values('bucket')
+        .annotate(sales=Sum('revenue'))
+        .order_by()
+    )
+    sales = {row['bucket']: float(row['sales'] or 0) for row in rows}
+    return [sales.get(bucket, 0) for bucket in chart_range.buckets]
+
+
+def top_products(chart_range, limit=5):
+    """The best selling products by revenue within the range"""
+    rows = (
+        DailySalesRollup.objects.product_totals()
+        .filter(date__gte=chart_range.start, date__lte=chart_range.end)
+        .annotate(name_key=ITEM_NAME_KEY)
+        .values('product_id', 'name_key')
+        .annotate(name=PRODUCT_LABEL, sales=Sum('revenue'))
+        .order_by('-sales')[:limit]
+    )
+    return [(row['name'], float(row['sales'] or 0)) for row in rows]
+
+
+def sales_by_category(categories, chart_range):
+    """Revenue per category within the range, in the order of categories"""
+    totals = dict(
+        DailySalesRollup.objects.product_totals()
+        .filter(date__gte=chart_range.start, date__lte=chart_range.end, category__isnull=False)
+        .values_list('category_id')
+        .annotate(sales=Sum('revenue'))
+        .order_by()
+    )
+    return [float(totals.get(category.id) or 0) for category in categories]
+
+
+def order_status_counts(chart_range):
+    """Number of orders placed within the range in each status, in STATUS_CHOICES order"""
+    counts = dict(
+        DailySalesRollup.objects.order_totals()
+        .filter(date__gte=chart_range.start, date__lte=chart_range.end)
+        .values_list('status')
+        .annotate(count=Sum('order_count'))
+        .order_by()
+    )
+    return [counts.get(status, 0) for status, _ in Order.STATUS_CHOICES]
+
+
+def registrations_series(chart_range):
+    """New users per bucket of the range"""
+    start_at, end_at = day_bounds(chart_range.start, chart_range.end + datetime.timedelta(days=1))
+    rows = (
+        User.objects.filter(date_joined__gte=start_at, date_joined__lt=end_at)
+        .annotate(bucket=chart_range.truncate('date_joined'))
+        .values('bucket')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    registrations = {row['bucket']: row['count'] for row in rows}
+    return [registrations.get(bucket, 0) for bucket in chart_range.buckets]
+
+
+def build_report(start, end):
+    """
+    Figures for the admin report page covering the dates in [start, end]
+    """
+    rollups = DailySalesRollup.objects.filter(date__gte=start, date__lte=end)
+    sold = rollups.exclude(status='cancelled')
+
+    orders = rollups.order_totals().aggregate(total_orders=Sum('order_count'))
+    sales = sold.order_totals().aggregate(total_revenue=Sum('revenue'), total_products_sold=Sum('units'))
+    cancelled = rollups.order_totals().filter(status='cancelled').aggregate(cancelled_orders=Sum('order_count'))
+
+    top_selling = (
+        sold.product_totals()
+        .annotate(name_key=ITEM_NAME_KEY)
+        .values('product_id', 'name_key')
+        .annotate(name=PRODUCT_LABEL, sales_count=Sum('units'), revenue=Sum('revenue'))
+        .order_by('-revenue')[:5]
+    )
+
+    total_revenue = sales['total_revenue'] or 0
+    category_sales = []
+    for row in (
+        sold.product_totals()
+        .filter(category__isnull=False)
+        .values('category__name')
+        .annotate(products_sold=Sum('units'), revenue=Sum('revenue'))
+        .order_by('-revenue')
+    ):
+        category_sales.append({
+            'name': row['category__name'],
+            'products_sold': row['products_sold'],
+            'revenue': row['revenue'],
+            'percentage': round(float(row['revenue'] / total_revenue * 100), 1) if total_revenue else 0,
+        })
+
+    return {
+        'total_orders': orders['total_orders'] or 0,
+        'total_revenue': total_revenue,
+        'total_products_sold': sales['total_products_sold'] or 0,
+        'cancelled_orders': cancelled['cancelled_orders'] or 0,
+        'top_products': [
+            {'name': row['name'], 'sales_count': row['sales_count'], 'revenue': row['revenue']}
+            for row in top_selling
+        ],
+        'category_sales': category_sales,
+    }
+
+
+def build_search_report(start_at, end_at, limit=SEARCH_REPORT_ROWS):
+    """
+    Figures for the staff search report over SearchLog rows logged in
+    [start_at, end_at): totals, the most frequent queries, the most frequent
+    queries finding nothing and the slowest queries
+    """
+    logs = SearchLog.objects.filter(created_at__gte=start_at, created_at__lt=end_at)
+    totals = logs.aggregate(
+        searches=Count('id'),
+        zero_results=Count('id', filter=Q(result_count=0)),
+        fuzzy=Count('id', filter=Q(fuzzy=True)),
+        avg_latency=Avg('latency_ms'),
+    )
+    searches = totals['searches']
+    # The 95th percentile is the row 5% from the top when sorted by latency
+    p95_latency = None
+    if searches:
+        p95_latency = logs.order_by('-latency_ms').values_list('latency_ms', flat=True)[searches // 20]
+
+    by_query = logs.values('query').annotate(
+        searches=Count('id'),
+        avg_results=Avg('result_count'),
+        avg_latency=Avg('latency_ms'),
+        max_latency=Max('latency_ms'),
+    )
+
+    return {
+        'total_searches': searches,
+        'zero_result_searches': totals['zero_results'],
+        'zero_result_percentage': round(totals['zero_results'] / searches * 100, 1) if searches else 0,
+        'fuzzy_searches': totals['fuzzy'],
+        'avg_latency': totals['avg_latency'],
+        'p95_latency': p95_latency,
+        'top_queries': list(by_query.order_by('-searches', 'query')[:limit]),
+        'zero_result_queries': list(
+            logs.filter(result_count=0)
+            .values('query')
+            .annotate(searches=Count('id'), last_searched=Max('created_at'))
+            .order_by('-searches', 'query')[:limit]
+        ),
+        'slowest_queries': list(by_query.order_by('-avg_latency', 'query')[:limit]),
+    }
+
+
+def build_chart_data(chart_range=None, categories=None):
+    """
+    Build the chart payload consumed by static/js/dashboard_charts.js
+    """
+    chart_range = chart_range or ChartRange.from_params({})
+    if categories is None:
+        categories = Category.objects.all()
+
+    # Sales trend
+    sales_labels = chart_range.labels
+    sales_data = sales_series(chart_range)
+
+    # Category distribution
+    category_labels = [category.name for category in categories]
+    category_data = sales_by_category(categories, chart_range)
+
+    # Top products
+    best_sellers = top_products(chart_range)
+    top_product_labels = [p[0] for p in best_sellers]
+    top_product_data = [p[1] for p in best_sellers]
+
+    # Order status data
+    status_labels = [status.capitalize() for status, _ in Order.STATUS_CHOICES]
+    status_data = order_status_counts(chart_range)
+
+    # New users registration trend
+    user_reg_data = registrations_series(chart_range)
+
+    # Sales comparison with the period of equal length before the range
+    previous_range = chart_range.previous()
+    previous_data = sales_series(previous_range)
+    periods = max(len(sales_data), len(previous_data))
+    comparison_labels = [f'{chart_range.granularity.capitalize()} {i + 1}' for i in range(periods)]
+
+    return {
+        'salesTrendData': {
+            'labels': sales_labels,
+            'datasets': [{
+                'label': 'Sales',
+                'data': sales_data,
+                'borderColor': '#6c63ff',
+                'backgroundColor': 'rgba(108, 99, 255, 0.2)',
+                'borderWidth': 3,
+                'pointRadius': 4,
+                'fill': True,
+                'tension': 0.4
+            }]
+        },
+        'categoryData': {
+            'labels': category_labels,
+            'datasets': [{
+                'data': category_data,
+                'backgroundColor': CATEGORY_COLORS,
+                'borderColor': '#1a1b3c',
+                'borderWidth': 2,
+                'hoverOffset': 15
+            }]
+        },
+        'orderStatusData': {
+            'labels': status_labels,
+            'datasets': [{
+                'data': status_data,
+                'backgroundColor': STATUS_COLORS,
+                'borderWidth': 0,
+                'borderRadius': 4,
+                'barThickness': 16
+            }]
+        },
+        'topProductsData': {
+            'labels': top_product_labels,
+            'datasets': [{
+                'axis': 'y',
+                'label': 'Sales',
+                'data': top_product_data,
+                'backgroundColor': TOP_PRODUCT_COLORS,
+                'borderWidth': 1,
+                'borderRadius': 4
+            }]
+        },
+        'userRegistrationData': {
+            'labels': sales_labels,
+            'datasets': [{
+                'label': 'New Users',
+                'data': user_reg_data,
+                'backgroundColor': 'rgba(77, 201, 255, 0.2)',
+                'borderColor': '#4dc9ff',
+                'borderWidth': 2,
+                'fill': True,
+                'tension': 0.4
+            }]
+        },
+        'comparisonData': {
+            'labels': comparison_labels,
+            'datasets': [
+                {
+                    'label': 'Current Period',
+                    'data': sales_data,
+                    'backgroundColor': 'rgba(108, 99, 255, 0.2)',
+                    'borderColor': '#6c63ff',
+                    'borderWidth': 2,
+                    'pointRadius': 4
+                },
+                {
+                    'label': 'Previous Period',
+                    'data': previous_data,
+                    'backgroundColor': 'rgba(255, 107, 107, 0.2)',
+                    'borderColor': '#ff6b6b',
+                    'borderWidth': 2,
+                    'pointRadius': 4
+                }
+            ]
+        }
+    }
+
+
+def chart_data_version():
+    """
+    Return (last_modified, etag) describing the data behind the charts.
+
+    Changes to the models the charts read call invalidate_chart_data() (see
+    store.signals), which records when the data last changed and bumps the
+    cache generation, so the version costs two cache reads and no queries.
+    Rolling windows move every day, so it never predates today's midnight.
+    """
+    midnight = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    generation = cache.get_or_set(CHART_CACHE_GENERATION_KEY, 0, None)
+    changed = cache.get_or_set(CHART_DATA_CHANGED_KEY, time.time, None)
+
+    last_modified = max(midnight, datetime.datetime.fromtimestamp(changed, datetime.timezone.utc)).replace(microsecond=0)
+    etag = '%d-%d' % (last_modified.timestamp(), generation)
+    return last_modified, etag
+
+
+def get_chart_data(version, chart_range=None):
+    """
+    Return (data, version) for the chart payload of a range, recomputing it at
+    most once per time bucket and whenever the underlying data version changes.
+
+    The returned version is the one the payload was computed against. Once the
+    cached payload is out of date, the first request to take the lock
+    recomputes it while concurrent requests keep getting the previous payload.
+    """
+    chart_range = chart_range or ChartRange.from_params({})
+    key = f'{CHART_CACHE_KEY}:{chart_range.cache_key}'
+    lock_key = f'{CHART_CACHE_LOCK_KEY}:{chart_range.cache_key}'
+    bucket = int(time.time() // CHART_CACHE_BUCKET)
+    generation = cache.get_or_set(CHART_CACHE_GENERATION_KEY, 0, None)
+
+    cached = cache.get(key)
+    if (
+        cached is not None
+        and cached['bucket'] == bucket
+        and cached['generation'] == generation
+        and cached['version'] == version
+    ):
+        return cached['data'], cached['version']
+
+    if not cache.add(lock_key, True, CHART_CACHE_LOCK_TIMEOUT):
+        if cached is not None:
+            return cached['data'], cached['version']
+        # Nothing to fall back on yet, compute without touching the cache
+        return build_chart_data(chart_range), version
+
+    try:
+        data = build_chart_data(chart_range)
+        cache.set(key, {
+            'bucket': bucket,
+            'generation': generation,
+            'version': version,
+            'data': data,
+        }, CHART_CACHE_TIMEOUT)
+    finally:
+        cache.delete(lock_key)
+    return data, version
+
+
+def invalidate_chart_data():
+    """
+    Mark every cached chart payload stale so the next request recomputes it,
+    and move the version clients revalidate against
+    """
+    cache.set(CHART_DATA_CHANGED_KEY, time.time(), None)
+    try:
+        cache.incr(CHART_CACHE_GENERATION_KEY)
+    except ValueError:
+        # No payload was cached under a generation yet
+        pass
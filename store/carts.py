@@ -0,0 +1,256 @@
+"""
+Carts and where they are kept.
+
+Backends, chosen with the STORE_CART_BACKEND setting ('database' by default):
+
+- 'database': every cart is a Cart row with CartItem rows, anonymous carts
+  keyed by the session and merged into the user's cart at login.
+- 'cache': anonymous carts are a {product_id: quantity} dict in the cache,
+  under a random token kept in a cookie and expiring CART_CACHE_TIMEOUT
+  after the last change. Browsing and filling a cart writes nothing to the
+  database, not even a session; the cart becomes Cart/CartItem rows only
+  when the visitor logs in (checkout requires it). Carts of signed-in users
+  are always in the database. The cache must be shared by all processes
+  (e.g. Redis) in production; the default in-memory cache is fine for tests
+  and a single-process server.
+
+The header badge shows the number of units in the cart on every page. For
+database carts the count is kept in the session, stored by the views that
+change a cart with remember_cart_count(); a session without it (a new login,
+an expired session) recomputes it once. Cached carts are counted straight
+from the cache.
+"""
+import re
+import secrets
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import CENT, Cart, Product
+
+CART_COUNT_SESSION_KEY = 'cart_count'
+CART_ID_SESSION_KEY = 'cart_id'
+CART_COOKIE_NAME = 'cart_token'
+CART_CACHE_TIMEOUT = 14 * 24 * 60 * 60
+CART_TOKEN_PATTERN = re.compile(r'[A-Za-z0-9_-]{32}')
+
+
+class CachedCartItem:
+    """A line of a CachedCart, with the CartItem attributes the templates use"""
+
+    def __init__(self, product, quantity):
+        self.product = product
+        self.quantity = quantity
+
+    @property
+    def id(self):
+        # Cached carts have one line per product, the product id names it
+        return self.product.pk
+
+    def subtotal(self):
+        return self.product.get_display_price() * self.quantity
+
+
+class CachedCart:
+    """An anonymous cart held in the cache, with the same methods as Cart"""
+
+    def __init__(self, token, quantities=None):
+        self.token = token
+        self.quantities = quantities or {}
+
+    def save(self):
+        cache.set(cart_cache_key(self.token), self.quantities, CART_CACHE_TIMEOUT)
+
+    def delete(self):
+        cache.delete(cart_cache_key(self.token))
+
+    def line_items(self):
+        products = Product.objects.in_bulk(self.quantities)
+        return [
+            CachedCartItem(products[product_id], quantity)
+            for product_id, quantity in self.quantities.items()
+            if product_id in products
+        ]
+
+    def item_count(self):
+        return sum(self.quantities.values())
+
+    def total(self):
+        return self.summary()['total']
+
+    def summary(self):
+        items = self.line_items()
+        return {
+            'total': sum((item.subtotal() for item in items), Decimal(0)).quantize(CENT),
+            'item_count': sum(item.quantity for item in items),
+        }
+
+    def get_item(self, item_id):
+        quantity = self.quantities.get(item_id)
+        product = Product.objects.filter(pk=item_id).first() if quantity else None
+        if product is None:
+            return None
+        return CachedCartItem(product, quantity)
+
+    def add_product(self, product, quantity=1):
+        self.quantities[product.pk] = self.quantities.get(product.pk, 0) + quantity
+        self.save()
+        return CachedCartItem(product, self.quantities[product.pk])
+
+    def set_quantity(self, item, quantity):
+        item.quantity = self.quantities[item.id] = quantity
+        self.save()
+
+    def remove_item(self, item):
+        self.quantities.pop(item.id, None)
+        self.save()
+
+
+def cart_cache_key(token):
+    return f'store:cart:{token}'
+
+
+class DatabaseCartBackend:
+    name = 'database'
+
+    def get_cart(self, request, create=False):
+        if request.user.is_authenticated:
+            if create:
+                return Cart.objects.get_or_create(user=request.user)[0]
+            return Cart.objects.filter(user=request.user).first()
+
+        session_id = request.session.session_key
+        if not session_id:
+            if not create:
+                return None
+            request.session.create()
+            session_id = request.session.session_key
+        if create:
+            cart = Cart.objects.get_or_create(session_id=session_id)[0]
+            # Logging in replaces the session key but keeps the session's
+            # data, this is how claim_cart() finds the cart again
+            request.session[CART_ID_SESSION_KEY] = cart.pk
+            return cart
+        return Cart.objects.filter(session_id=session_id).first()
+
+    def cart_count(self, request):
+        count = request.session.get(CART_COUNT_SESSION_KEY)
+        if count is not None:
+            return count
+
+        if not request.user.is_authenticated and not request.session.session_key:
+            # A visitor without a session has no cart, and storing the count
+            # would start a session for every anonymous page view
+            return 0
+
+        cart = self.get_cart(request)
+        if cart is None:
+            count = 0
+            request.session[CART_COUNT_SESSION_KEY] = count
+            return count
+        return remember_cart_count(request, cart)
+
+    def claim_cart(self, request, user):
+        """
+        Move the visitor's anonymous cart into the cart of user, who just
+        logged in. A user without a cart takes the anonymous one over,
+        otherwise the items are merged and the anonymous cart deleted.
+        """
+        cart_id = request.session.pop(CART_ID_SESSION_KEY, None)
+        anonymous = Cart.objects.filter(pk=cart_id, user__isnull=True).first() if cart_id else None
+        if anonymous is None:
+            return
+
+        with transaction.atomic():
+            cart = Cart.objects.select_for_update().filter(user=user).first()
+            if cart is None:
+                anonymous.user = user
+                anonymous.session_id = None
+                anonymous.save()
+            else:
+                cart.merge(anonymous)
+
+
+class CacheCartBackend(DatabaseCartBackend):
+    name = 'cache'
+
+    def cart_token(self, request):
+        token = request.COOKIES.get(CART_COOKIE_NAME, '')
+        return token if CART_TOKEN_PATTERN.fullmatch(token) else None
+
+    def get_cart(self, request, create=False):
+        if request.user.is_authenticated:
+            return super().get_cart(request, create)
+
+        token = self.cart_token(request)
+        quantities = cache.get(cart_cache_key(token)) if token else None
+        if quantities is None:
+            if not create:
+                return None
+            # Nothing is cached until a product is added
+            return CachedCart(token or secrets.token_urlsafe(24))
+        return CachedCart(token, quantities)
+
+    def cart_count(self, request):
+        if request.user.is_authenticated:
+            return super().cart_count(request)
+        cart = self.get_cart(request)
+        return cart.item_count() if cart else 0
+
+    def claim_cart(self, request, user):
+        # Database carts from before the switch to this backend
+        super().claim_cart(request, user)
+
+        token = self.cart_token(request)
+        quantities = cache.get(cart_cache_key(token)) if token else None
+        if quantities:
+            Cart.objects.get_or_create(user=user)[0].add_quantities(quantities)
+            cache.delete(cart_cache_key(token))
+
+
+CART_BACKENDS = {backend.name: backend for backend in (DatabaseCartBackend, CacheCartBackend)}
+
+
+def get_cart_backend():
+    return CART_BACKENDS[getattr(settings, 'STORE_CART_BACKEND', 'database')]()
+
+
+def get_cart(request):
+    """The visitor's cart if there is one, never creating it"""
+    return get_cart_backend().get_cart(request)
+
+
+def get_or_create_cart(request):
+    return get_cart_backend().get_cart(request, create=True)
+
+
+def set_cart_cookie(response, cart):
+    """Point the visitor's browser at a cached cart, or refresh its expiry"""
+    if isinstance(cart, CachedCart):
+        response.set_cookie(
+            CART_COOKIE_NAME, cart.token, max_age=CART_CACHE_TIMEOUT,
+            httponly=True, samesite='Lax', secure=settings.SESSION_COOKIE_SECURE,
+        )
+    return response
+
+
+def remember_cart_count(request, cart, count=None):
+    """Store and return the unit count of cart, counted unless already known"""
+    if count is None:
+        count = cart.item_count()
+    # Cached carts are counted from the cache, keeping anonymous visitors
+    # out of the session table
+    if not isinstance(cart, CachedCart):
+        request.session[CART_COUNT_SESSION_KEY] = count
+    return count
+
+
+def forget_cart_count(request):
+    request.session.pop(CART_COUNT_SESSION_KEY, None)
+
+
+def get_cart_count(request):
+    """The unit count for the cart badge"""
+    return get_cart_backend().cart_count(request)
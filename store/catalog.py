@@ -0,0 +1,61 @@
+"""
+Catalog bookkeeping.
+
+Cached catalog data (listing pages, shelves, search results) is keyed by a
+catalog version that is bumped whenever a product or category changes, so
+invalidating everything is a single cache write.
+
+Category.product_count is a stored count kept up to date by store.signals;
+reconcile_category_counts() repairs it after bulk changes that bypass
+signals (QuerySet.update(), bulk_create(), raw SQL).
+"""
+from django.core.cache import cache
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Category, Product
+
+CATALOG_VERSION_KEY = 'store:catalog:version'
+
+
+def catalog_version():
+    return cache.get_or_set(CATALOG_VERSION_KEY, 1, None)
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # Nothing has been cached against a version yet
+        cache.set(CATALOG_VERSION_KEY, 1, None)
+
+
+def adjust_product_count(category_id, delta):
+    """Add delta to a category's product count in a single UPDATE"""
+    if category_id is None:
+        return
+    categories = Category.objects.filter(pk=category_id)
+    if delta < 0:
+        # A count already too low after a bulk change must not go negative
+        categories = categories.filter(product_count__gte=-delta)
+    categories.update(product_count=F('product_count') + delta)
+
+
+def reconcile_category_counts():
+    """Recount the products of every category, returns how many counts were wrong"""
+    counts = (
+        Product.objects.filter(category=OuterRef('pk'))
+        .order_by()
+        .values('category')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    actual = Coalesce(Subquery(counts), 0)
+    stale = list(
+        Category.objects.annotate(actual=actual)
+        .exclude(product_count=F('actual'))
+        .values_list('pk', flat=True)
+    )
+    if stale:
+        Category.objects.filter(pk__in=stale).update(product_count=actual)
+    return len(stale)
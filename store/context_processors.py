@@ -1,24 +1,8 @@
-from .models import Cart
+from .carts import get_cart_count
 
 def cart_count(request):
     """
-    Context processor to add cart count to every template
+    Context processor to add cart count to every template. The count lives
+    in the session (see store.carts), so most pages run no cart queries.
     """
-    count = 0
-    
-    if request.user.is_authenticated:
-        try:
-            cart = Cart.objects.get(user=request.user)
-            count = cart.items.count()
-        except Cart.DoesNotExist:
-            pass
-    else:
-        session_id = request.session.session_key
-        if session_id:
-            try:
-                cart = Cart.objects.get(session_id=session_id)
-                count = cart.items.count()
-            except Cart.DoesNotExist:
-                pass
-    
-    return {'cart_count': count}
\ No newline at end of file
+    return {'cart_count': get_cart_count(request)}
@@ -0,0 +1,134 @@
+"""
+Facet counts for the search sidebar.
+
+All facets come from one grouped query over the products matching the search
+text. Each group row carries every facet value (category, price bucket, in
+stock, featured) plus whether it falls in the selected price range, so the
+count for each facet option can be summed in Python with every filter
+applied except that facet's own, the usual faceting behaviour that shows
+what changing one filter would give.
+"""
+from decimal import Decimal
+
+from django.db.models import BooleanField, Case, Count, IntegerField, Q, Value, When
+
+# Prices have two decimal places, a bucket's price filter stops a cent short
+# of the next bucket
+CENT = Decimal('0.01')
+
+# (label, min, max) of each price bucket, max exclusive
+PRICE_BUCKETS = (
+    ('$0 - $50', 0, 50),
+    ('$50 - $100', 50, 100),
+    ('$100 - $200', 100, 200),
+    ('$200+', 200, None),
+)
+
+
+def parse_price(value):
+    """A price filter from the query string, None when missing or invalid"""
+    try:
+        price = Decimal(value)
+    except (ArithmeticError, TypeError, ValueError):
+        return None
+    if not price.is_finite() or price < 0:
+        return None
+    return price
+
+
+def price_bucket():
+    return Case(
+        *[
+            When(price__lt=high, then=Value(position))
+            for position, (_, _, high) in enumerate(PRICE_BUCKETS) if high is not None
+        ],
+        default=Value(len(PRICE_BUCKETS) - 1),
+        output_field=IntegerField(),
+    )
+
+
+def price_range(min_price=None, max_price=None):
+    condition = Q()
+    if min_price is not None:
+        condition &= Q(price__gte=min_price)
+    if max_price is not None:
+        condition &= Q(price__lte=max_price)
+    if not condition:
+        return Value(True)
+    return Case(When(condition, then=Value(True)), default=Value(False), output_field=BooleanField())
+
+
+def facet_counts(products, category_id=None, min_price=None, max_price=None,
+                 in_stock=False, featured=False):
+    """
+    Facet counts over products, a queryset matching the search text with none
+    of the sidebar filters applied. Only plain numbers are returned, so the
+    counts can be cached.
+    """
+    rows = (
+        products.order_by()
+        .annotate(
+            bucket=price_bucket(),
+            available=Case(When(stock__gt=0, then=Value(True)), default=Value(False), output_field=BooleanField()),
+            in_range=price_range(min_price, max_price),
+        )
+        .values('category_id', 'bucket', 'available', 'is_featured', 'in_range')
+        .annotate(count=Count('id'))
+    )
+
+    category_counts = {}
+    bucket_counts = [0] * len(PRICE_BUCKETS)
+    in_stock_count = featured_count = total = 0
+    for row in rows:
+        matches = {
+            'category': category_id is None or row['category_id'] == category_id,
+            'price': row['in_range'],
+            'in_stock': not in_stock or row['available'],
+            'featured': not featured or row['is_featured'],
+        }
+
+        def matches_except(facet):
+            return all(matched for name, matched in matches.items() if name != facet)
+
+        count = row['count']
+        if matches_except(None):
+            total += count
+        if matches_except('category'):
+            category_counts[row['category_id']] = category_counts.get(row['category_id'], 0) + count
+        if matches_except('price'):
+            bucket_counts[row['bucket']] += count
+        if matches_except('in_stock') and row['available']:
+            in_stock_count += count
+        if matches_except('featured') and row['is_featured']:
+            featured_count += count
+
+    return {
+        'total': total,
+        'categories': category_counts,
+        'price_buckets': bucket_counts,
+        'in_stock': in_stock_count,
+        'featured': featured_count,
+    }
+
+
+def search_facets(counts, categories, min_price=None, max_price=None):
+    """Facet counts laid out for the sidebar template"""
+    price_buckets = []
+    for (label, low, high), count in zip(PRICE_BUCKETS, counts['price_buckets']):
+        low = Decimal(low)
+        high = high - CENT if high is not None else None
+        price_buckets.append({
+            'label': label,
+            'min': low,
+            'max': high,
+            'count': count,
+            'active': min_price == low and max_price == high,
+        })
+
+    return {
+        'total': counts['total'],
+        'categories': [(category, counts['categories'].get(category.id, 0)) for category in categories],
+        'price_buckets': price_buckets,
+        'in_stock': counts['in_stock'],
+        'featured': counts['featured'],
+    }
@@ -0,0 +1,150 @@
+"""
+Typo-tolerant product search over trigrams of product and category names.
+
+A word is split into the three-letter runs of its padded form, as pg_trgm
+does ("lamp" gives "  l", " la", "lam", "amp", "mp "), and a misspelled word
+still shares most of them with the right one. A product is similar to a query
+when it holds at least FUZZY_THRESHOLD of the query's trigrams.
+
+On PostgreSQL the pg_trgm extension does the work against GIN indexes on the
+names, both created by migration 0010. Other databases use ProductTrigram, a
+lookup table with one row per distinct trigram of each product's name and
+category name, kept in step with products by store.signals.
+"""
+import math
+import re
+
+from django.db import connection
+from django.db.models import Case, Count, F, FloatField, Q, Value, When
+from django.db.models.functions import Greatest
+
+from .models import Product, ProductTrigram
+
+# Share of the query's trigrams a product must hold, pg_trgm's default
+# word_similarity_threshold is 0.6
+FUZZY_THRESHOLD = 0.5
+# Most similar products considered, which also caps the IN (...) list
+FUZZY_LIMIT = 200
+# Searches with fewer exact results than this also get similar products
+FUZZY_MIN_RESULTS = 5
+# Exact matches rank above any similarity, which is at most 1
+FUZZY_EXACT_RANK = 2.0
+
+
+def trigrams(text):
+    """Distinct trigrams of the words of text"""
+    grams = set()
+    for word in re.findall(r'\w+', (text or '').lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def uses_pg_trgm():
+    return connection.vendor == 'postgresql'
+
+
+def index_product_trigrams(product, category_name=None):
+    """Bring a product's rows in ProductTrigram up to date, touching only what changed"""
+    if uses_pg_trgm():
+        return
+    if category_name is None:
+        category_name = product.category.name
+    wanted = trigrams(product.name) | trigrams(category_name)
+    existing = set(ProductTrigram.objects.filter(product_id=product.pk).values_list('trigram', flat=True))
+    if existing - wanted:
+        ProductTrigram.objects.filter(product_id=product.pk, trigram__in=existing - wanted).delete()
+    ProductTrigram.objects.bulk_create(
+        [ProductTrigram(product_id=product.pk, trigram=gram) for gram in wanted - existing],
+        ignore_conflicts=True,
+    )
+
+
+def index_category_trigrams(category):
+    """Renaming a category changes the trigrams of all of its products"""
+    if uses_pg_trgm():
+        return
+    for product in category.products.only('id', 'name').iterator(chunk_size=2000):
+        index_product_trigrams(product, category.name)
+
+
+def rebuild_trigrams(batch_size=5000):
+    """Rebuild ProductTrigram from scratch, returns the number of rows written"""
+    if uses_pg_trgm():
+        return 0
+    ProductTrigram.objects.all().delete()
+    rows = Product.objects.order_by('id').values_list('id', 'name', 'category__name').iterator(chunk_size=2000)
+    batch = []
+    written = 0
+    for product_id, name, category_name in rows:
+        batch.extend(
+            ProductTrigram(product_id=product_id, trigram=gram)
+            for gram in trigrams(name) | trigrams(category_name)
+        )
+        if len(batch) >= batch_size:
+            ProductTrigram.objects.bulk_create(batch)
+            written += len(batch)
+            batch = []
+    ProductTrigram.objects.bulk_create(batch)
+    return written + len(batch)
+
+
+def similar_products(query, limit=FUZZY_LIMIT):
+    """Return [(product_id, similarity)] of the products most similar to query, best first"""
+    if uses_pg_trgm():
+        return pg_similar_products(query, limit)
+
+    grams = trigrams(query)
+    if not grams:
+        return []
+    needed = math.ceil(len(grams) * FUZZY_THRESHOLD)
+    rows = (
+        ProductTrigram.objects.filter(trigram__in=grams)
+        .values('product_id')
+        .annotate(shared=Count('id'))
+        .filter(shared__gte=needed)
+        .order_by('-shared', '-product_id')
+        .values_list('product_id', 'shared')[:limit]
+    )
+    return [(product_id, shared / len(grams)) for product_id, shared in rows]
+
+
+def pg_similar_products(query, limit=FUZZY_LIMIT):
+    from django.contrib.postgres.lookups import TrigramWordSimilar
+    from django.contrib.postgres.search import TrigramWordSimilarity
+
+    # The %> operator uses the GIN trigram indexes, and its threshold is
+    # pg_trgm.word_similarity_threshold rather than FUZZY_THRESHOLD
+    rows = (
+        Product.objects.filter(
+            TrigramWordSimilar(F('name'), Value(query)) |
+            TrigramWordSimilar(F('category__name'), Value(query))
+        )
+        .annotate(similarity=Greatest(
+            TrigramWordSimilarity(query, 'name'),
+            TrigramWordSimilarity(query, 'category__name'),
+        ))
+        .order_by('-similarity', '-id')
+        .values_list('id', 'similarity')[:limit]
+    )
+    return list(rows)
+
+
+def with_similar_products(products, matches):
+    """The products of a search plus the similar ones from similar_products()"""
+    return Product.objects.filter(
+        Q(pk__in=products.values('pk')) | Q(pk__in=[product_id for product_id, _ in matches])
+    )
+
+
+def rank_similar_products(products, exact, matches):
+    """Order products exact matches first, then by similarity, then newest first"""
+    rank = Case(
+        When(pk__in=exact.values('pk'), then=Value(FUZZY_EXACT_RANK)),
+        *[When(pk=product_id, then=Value(float(similarity))) for product_id, similarity in matches],
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    return products.annotate(search_rank=rank).order_by(
+        F('search_rank').desc(nulls_last=True), '-created_at', '-id'
+    )
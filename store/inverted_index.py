@@ -0,0 +1,148 @@
+"""
+A compact in-memory inverted index.
+
+Every term maps to two parallel arrays: the ids of the documents containing
+it, kept sorted, and the weight of the term in each of those documents.
+Arrays of machine integers take a fraction of the memory of dicts or sets of
+Python ints, and sorted ids make single-document updates a bisect away. The
+sorted vocabulary answers prefix lookups the same way.
+"""
+import bisect
+import heapq
+import math
+import re
+import sys
+import threading
+from array import array
+
+MAX_WEIGHT = 65535
+MAX_PREFIX_TERMS = 100
+
+
+def stem(word):
+    """A light English stemmer, plurals and -ing/-ed forms share a stem"""
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith(('sses', 'xes', 'zes', 'ches', 'shes')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    for suffix in ('ing', 'ed'):
+        if len(word) - len(suffix) >= 3 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text):
+    return [sys.intern(stem(word)) for word in re.findall(r'\w+', text.lower())]
+
+
+class InvertedIndex:
+    """
+    Documents are added as (id, [(text, weight), ...]) and searched with
+    every query word matched as a prefix, ranked by summed weight times IDF.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.vocabulary = []
+        self.documents = {}
+        # Bumped by every change, tells whether earlier search results still hold
+        self.generation = 0
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def term_weights(self, fields):
+        weights = {}
+        for text, weight in fields:
+            for term in tokenize(text or ''):
+                weights[term] = min(weights.get(term, 0) + weight, MAX_WEIGHT)
+        return weights
+
+    def build(self, documents):
+        """Index documents from scratch, they must arrive in ascending id order"""
+        postings = {}
+        stored = {}
+        for doc_id, fields in documents:
+            weights = self.term_weights(fields)
+            stored[doc_id] = tuple(weights)
+            for term, weight in weights.items():
+                if term not in postings:
+                    postings[term] = (array('I'), array('H'))
+                ids, term_weights = postings[term]
+                ids.append(doc_id)
+                term_weights.append(weight)
+
+        with self.lock:
+            self.postings = postings
+            self.vocabulary = sorted(postings)
+            self.documents = stored
+            self.generation += 1
+
+    def add(self, doc_id, fields):
+        """Add or replace a single document"""
+        weights = self.term_weights(fields)
+        with self.lock:
+            self.remove(doc_id)
+            self.generation += 1
+            self.documents[doc_id] = tuple(weights)
+            for term, weight in weights.items():
+                if term not in self.postings:
+                    self.postings[term] = (array('I'), array('H'))
+                    bisect.insort(self.vocabulary, term)
+                ids, term_weights = self.postings[term]
+                position = bisect.bisect_left(ids, doc_id)
+                ids.insert(position, doc_id)
+                term_weights.insert(position, weight)
+
+    def remove(self, doc_id):
+        with self.lock:
+            self.generation += 1
+            for term in self.documents.pop(doc_id, ()):
+                ids, term_weights = self.postings[term]
+                position = bisect.bisect_left(ids, doc_id)
+                del ids[position]
+                del term_weights[position]
+                if not ids:
+                    del self.postings[term]
+                    del self.vocabulary[bisect.bisect_left(self.vocabulary, term)]
+
+    def expand(self, prefix):
+        """Indexed terms starting with prefix, at most MAX_PREFIX_TERMS of them"""
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        terms = []
+        for term in self.vocabulary[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def search(self, query, limit=None):
+        """Return [(doc_id, score)] of documents matching every query word, best first"""
+        words = tokenize(query)
+        if not words:
+            return []
+
+        with self.lock:
+            total = len(self.documents) or 1
+            matches = None
+            for word in words:
+                scores = {}
+                for term in self.expand(word):
+                    ids, weights = self.postings[term]
+                    idf = math.log(1 + total / len(ids))
+                    for doc_id, weight in zip(ids, weights):
+                        if matches is None or doc_id in matches:
+                            scores[doc_id] = scores.get(doc_id, 0.0) + weight * idf
+                if matches is not None:
+                    for doc_id, score in scores.items():
+                        scores[doc_id] = score + matches[doc_id]
+                matches = scores
+                if not matches:
+                    return []
+
+        if limit is None:
+            return sorted(matches.items(), key=lambda item: item[1], reverse=True)
+        return heapq.nlargest(limit, matches.items(), key=lambda item: item[1])
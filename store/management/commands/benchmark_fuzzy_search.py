@@ -0,0 +1,131 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.text import slugify
+
+from store.fuzzy import rebuild_trigrams, similar_products
+from store.management.commands.benchmark_search_index import (
+    CATEGORY_COUNT, WORDS_IN_VOCABULARY, percentile, synthetic_words,
+)
+from store.models import Category, Product, ProductTrigram
+
+WORDS_PER_NAME = 3
+
+
+def misspell(rng, word):
+    """The kinds of typo people make: a letter dropped, doubled, swapped or replaced"""
+    position = rng.randrange(len(word) - 1)
+    kind = rng.choice(('drop', 'double', 'swap', 'replace'))
+    if kind == 'drop':
+        return word[:position] + word[position + 1:]
+    if kind == 'double':
+        return word[:position] + word[position] + word[position:]
+    if kind == 'swap':
+        return word[:position] + word[position + 1] + word[position] + word[position + 2:]
+    return word[:position] + rng.choice('abcdefghijklmnopqrstuvwxyz') + word[position + 1:]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the query latency of fuzzy (trigram) search against synthetic products. '
+        'It writes them to the database, so it asks for --yes, and deletes them again when it finishes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--products', type=int, default=100000,
+            help='Number of synthetic products to create (default: 100000)',
+        )
+        parser.add_argument(
+            '--queries', type=int, default=500,
+            help='Number of misspelled queries to time (default: 500)',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed, the same seed creates the same products (default: 0)',
+        )
+        parser.add_argument(
+            '--yes', action='store_true',
+            help='Confirm that the products may be written to the database, run it against a copy',
+        )
+
+    def handle(self, *args, **options):
+        if options['products'] < 1 or options['queries'] < 1:
+            raise CommandError('--products and --queries must be at least 1')
+
+        if not options['yes']:
+            raise CommandError(
+                f'This writes {options["products"]} products to {connection.settings_dict["NAME"]} '
+                'and rebuilds its trigram table. Run it against a copy of the database, and pass --yes.'
+            )
+
+        rng = random.Random(options['seed'])
+        vocabulary = synthetic_words(rng, WORDS_IN_VOCABULARY)
+
+        categories = Category.objects.bulk_create([
+            Category(name=f'{name} benchmark', slug=f'{slugify(name)}-benchmark-{number}')
+            for number, name in enumerate(rng.sample(vocabulary[:500], CATEGORY_COUNT))
+        ])
+        try:
+            self.benchmark(rng, vocabulary, categories, options['products'], options['queries'])
+        finally:
+            self.delete_products(categories)
+
+    def benchmark(self, rng, vocabulary, categories, product_count, query_count):
+        started = time.perf_counter()
+        # Bulk creation skips the signals, the trigram table is rebuilt below
+        Product.objects.bulk_create(
+            (
+                Product(
+                    category=rng.choice(categories),
+                    name=' '.join(rng.choices(vocabulary[:5000], k=WORDS_PER_NAME)),
+                    slug=f'benchmark-{number}',
+                    description='',
+                    price=rng.randint(1, 500),
+                )
+                for number in range(product_count)
+            ),
+            batch_size=2000,
+        )
+        trigram_rows = rebuild_trigrams()
+        self.stdout.write(
+            f'Created {product_count} products and {trigram_rows or "no"} trigram rows '
+            f'in {time.perf_counter() - started:.1f}s'
+        )
+
+        names = list(
+            Product.objects.filter(category__in=categories).order_by('?').values_list('name', flat=True)[:query_count]
+        )
+        queries = [misspell(rng, rng.choice(name.split())) for name in names]
+
+        timings = []
+        found = 0
+        for query in queries:
+            started = time.perf_counter()
+            matches = similar_products(query)
+            timings.append((time.perf_counter() - started) * 1e3)
+            found += bool(matches)
+
+        self.stdout.write(f'{found} of {len(queries)} misspelled queries found similar products')
+        self.stdout.write(self.style.SUCCESS(
+            f'Query latency over {len(timings)} queries at {Product.objects.count()} products '
+            f'({ProductTrigram.objects.count()} trigram rows): '
+            f'p50 {statistics.median(timings):.1f}ms, '
+            f'p95 {percentile(timings, 0.95):.1f}ms, '
+            f'max {max(timings):.1f}ms'
+        ))
+
+    def delete_products(self, categories):
+        """Delete the benchmark categories, their products and the products' trigrams"""
+        products = Product.objects.filter(category__in=categories)
+        ProductTrigram.objects.filter(product__in=products).delete()
+        # The products were created without their signals, delete them without too
+        sql, params = products.values('id').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {Product._meta.db_table} WHERE id IN ({sql})', params)
+            deleted = cursor.rowcount
+        Category.objects.filter(pk__in=[category.pk for category in categories]).delete()
+        self.stdout.write(f'Deleted the {deleted} benchmark products')
@@ -0,0 +1,111 @@
+import itertools
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.inverted_index import InvertedIndex
+from store.search import order_matches, product_fields
+
+WORDS_IN_VOCABULARY = 20000
+WORDS_PER_NAME = 3
+WORDS_PER_DESCRIPTION = 40
+CATEGORY_COUNT = 50
+
+
+def synthetic_words(rng, count):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choices(letters, k=rng.randint(4, 10))) for _ in range(count)]
+
+
+def synthetic_products(rng, vocabulary, count):
+    """Product-like documents whose words follow a Zipf-like distribution"""
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    categories = [' '.join(rng.sample(vocabulary[:500], 2)) for _ in range(CATEGORY_COUNT)]
+    for product_id in range(1, count + 1):
+        name = ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=WORDS_PER_NAME))
+        description = ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=WORDS_PER_DESCRIPTION))
+        yield product_id, product_fields(name, description, rng.choice(categories))
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure memory use, build time and query latency of the in-memory search index on synthetic '
+        'products, each query finding every match and ordering them as the memory search backend does'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--products', type=int, default=100000,
+            help='Number of synthetic products to index (default: 100000)',
+        )
+        parser.add_argument(
+            '--queries', type=int, default=1000,
+            help='Number of random queries to time (default: 1000)',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed, the same seed indexes the same products (default: 0)',
+        )
+
+    def handle(self, *args, **options):
+        if options['products'] < 1 or options['queries'] < 1:
+            raise CommandError('--products and --queries must be at least 1')
+
+        rng = random.Random(options['seed'])
+        vocabulary = synthetic_words(rng, WORDS_IN_VOCABULARY)
+        documents = list(synthetic_products(rng, vocabulary, options['products']))
+
+        index = InvertedIndex()
+        tracemalloc.start()
+        started = time.perf_counter()
+        index.build(documents)
+        build_seconds = time.perf_counter() - started
+        index_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        postings = sum(len(ids) for ids, _ in index.postings.values())
+        self.stdout.write(f'Indexed {len(index)} products, {len(index.vocabulary)} terms, {postings} postings')
+        self.stdout.write(f'Build time: {build_seconds:.2f}s')
+        self.stdout.write(
+            f'Memory: {index_bytes / 2 ** 20:.1f} MiB held by the index, '
+            f'{peak_bytes / 2 ** 20:.1f} MiB peak while building, '
+            f'{index_bytes / len(index):.0f} bytes per product'
+        )
+
+        # Queries of one or two words, the last one possibly cut short as when typing
+        queries = []
+        for _ in range(options['queries']):
+            words = rng.choices(vocabulary[:2000], k=rng.randint(1, 2))
+            words[-1] = words[-1][:rng.randint(3, len(words[-1]))]
+            queries.append(' '.join(words))
+
+        # Stand-ins for created_at, the tie-break after the score
+        created = {product_id: rng.random() for product_id, _ in documents}
+
+        timings = []
+        match_counts = []
+        for query in queries:
+            started = time.perf_counter()
+            scores = dict(index.search(query))
+            order_matches(scores, [(product_id, created[product_id]) for product_id in scores])
+            timings.append((time.perf_counter() - started) * 1e6)
+            match_counts.append(len(scores))
+
+        self.stdout.write(
+            f'Matches per query: p50 {statistics.median(match_counts):.0f}, '
+            f'p95 {percentile(match_counts, 0.95)}, max {max(match_counts)}'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Query latency over {len(timings)} queries, every match found and ordered: '
+            f'p50 {statistics.median(timings):.0f}us, '
+            f'p95 {percentile(timings, 0.95):.0f}us, '
+            f'max {max(timings):.0f}us'
+        ))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.exports import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_orders, export_rows, parse_export_filters
+
+
+class Command(BaseCommand):
+    help = 'Stream orders and their items as CSV or NDJSON without loading them all into memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help='Output format (default: csv)')
+        parser.add_argument('--start', help='Only orders placed on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--end', help='Only orders placed on or before this date (YYYY-MM-DD)')
+        parser.add_argument('--status', help='Only orders with this status')
+        parser.add_argument('--output', help='File to write to (default: stdout)')
+        parser.add_argument(
+            '--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+            help=f'Orders fetched per database round trip (default: {EXPORT_CHUNK_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            filters = parse_export_filters(options)
+        except ValueError as e:
+            raise CommandError(e)
+
+        rows = export_rows(options['format'], export_orders(chunk_size=options['chunk_size'], **filters))
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(rows)
+            self.stderr.write(self.style.SUCCESS(f"Orders exported to {options['output']}"))
+        else:
+            for row in rows:
+                self.stdout.write(row, ending='')
@@ -0,0 +1,73 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from store.models import Cart
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete database carts untouched for a number of days, a batch at a time so '
+        'that no transaction holds the write lock for long. Cached carts expire on their own.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=30,
+            help='Delete carts not changed for this many days (default: 30)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of carts deleted per transaction (default: 500)',
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0.1,
+            help='Seconds to pause between batches, letting other writers in (default: 0.1)',
+        )
+        parser.add_argument(
+            '--include-user-carts', action='store_true',
+            help='Also delete abandoned carts of signed-in users, not only anonymous ones',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Count the carts that would be deleted without deleting them',
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        cutoff = timezone.now() - datetime.timedelta(days=options['days'])
+        abandoned = Cart.objects.filter(updated_at__lt=cutoff)
+        if not options['include_user_carts']:
+            abandoned = abandoned.filter(user__isnull=True)
+
+        if options['dry_run']:
+            self.stdout.write(f'{abandoned.count()} carts untouched since {cutoff:%Y-%m-%d %H:%M} would be deleted')
+            return
+
+        started = time.monotonic()
+        carts = items = batches = 0
+        while True:
+            ids = list(abandoned.order_by('updated_at').values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            if batches:
+                time.sleep(options['sleep'])
+            with transaction.atomic():
+                # Filtered again in case a cart was changed since the ids were read
+                _, deleted = abandoned.filter(pk__in=ids).delete()
+            carts += deleted.get('store.Cart', 0)
+            items += deleted.get('store.CartItem', 0)
+            batches += 1
+            self.stdout.write(f'Batch {batches}: {carts} carts deleted so far')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Abandoned carts purged: {carts} carts and {items} cart items in {batches} batches, {elapsed:.2f}s'
+        ))
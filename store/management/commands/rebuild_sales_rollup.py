@@ -0,0 +1,48 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from store.models import DailySalesRollup, Order
+from store.rollups import local_date, refresh_days
+
+
+class Command(BaseCommand):
+    help = 'Backfill or rebuild the daily sales rollup from raw orders, a chunk of days at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='Number of days back from today to rebuild (default: 365)',
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Rebuild from the first order ever placed and drop rows older than it',
+        )
+        parser.add_argument(
+            '--chunk-days', type=int, default=7,
+            help='Number of days rebuilt per transaction (default: 7)',
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_days'] < 1:
+            raise CommandError('--chunk-days must be at least 1')
+
+        end = timezone.localdate() + datetime.timedelta(days=1)
+        if options['all']:
+            first_order = Order.objects.order_by('created_at').values_list('created_at', flat=True).first()
+            start = local_date(first_order) if first_order else end
+            DailySalesRollup.objects.filter(date__lt=start).delete()
+        else:
+            start = end - datetime.timedelta(days=options['days'])
+
+        chunk = datetime.timedelta(days=options['chunk_days'])
+        rows = 0
+        chunk_start = start
+        while chunk_start < end:
+            chunk_end = min(chunk_start + chunk, end)
+            rows += refresh_days(chunk_start, chunk_end)
+            self.stdout.write(f'Rebuilt {chunk_start} to {chunk_end - datetime.timedelta(days=1)}')
+            chunk_start = chunk_end
+
+        self.stdout.write(self.style.SUCCESS(f'Daily sales rollup rebuilt: {rows} rows from {start} to {end - datetime.timedelta(days=1)}'))
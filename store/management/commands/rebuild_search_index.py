@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from store.fuzzy import rebuild_trigrams, uses_pg_trgm
+from store.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product search and trigram indexes from scratch, e.g. after bulk imports'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        rows = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt with the {backend.name} backend: {rows} products indexed'))
+
+        if uses_pg_trgm():
+            self.stdout.write('Fuzzy search uses pg_trgm, no trigram table to rebuild')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Trigram index rebuilt: {rebuild_trigrams()} trigrams'))
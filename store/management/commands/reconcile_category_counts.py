@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from store.catalog import bump_catalog_version, reconcile_category_counts
+
+
+class Command(BaseCommand):
+    help = 'Recount the products of every category, e.g. after bulk imports or QuerySet.update() calls'
+
+    def handle(self, *args, **options):
+        fixed = reconcile_category_counts()
+        if fixed:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'Category product counts reconciled: {fixed} corrected'))
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_product_discount_percentage_product_is_best_seller_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('shipped', 'Shipped'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('product_name', models.CharField(blank=True, max_length=200)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='store.category')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='store.product')),
+            ],
+            options={
+                'ordering': ['date'],
+                'indexes': [models.Index(fields=['date', 'status'], name='store_daily_date_184a69_idx')],
+            },
+        ),
+    ]
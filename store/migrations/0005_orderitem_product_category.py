@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_dailysalesrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='store.category'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='store.product'),
+        ),
+    ]
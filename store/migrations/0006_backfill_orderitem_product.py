@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+def backfill_products(apps, schema_editor):
+    """Link existing order items to products (and their categories) by name"""
+    OrderItem = apps.get_model('store', 'OrderItem')
+    Product = apps.get_model('store', 'Product')
+
+    names = (
+        OrderItem.objects.filter(product__isnull=True)
+        .values_list('product_name', flat=True)
+        .distinct()
+    )
+    products = {}
+    for product_id, name, category_id in (
+        Product.objects.filter(name__in=list(names)).order_by('id').values_list('id', 'name', 'category_id')
+    ):
+        # Several products may share a name, the oldest one wins
+        products.setdefault(name, (product_id, category_id))
+
+    for name, (product_id, category_id) in products.items():
+        OrderItem.objects.filter(product__isnull=True, product_name=name).update(
+            product_id=product_id,
+            category_id=category_id,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_orderitem_product_category'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_products, migrations.RunPython.noop),
+    ]
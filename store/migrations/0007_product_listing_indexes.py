@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_backfill_orderitem_product'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-created_at', '-id'], name='product_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', '-created_at', '-id'], name='product_category_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_featured', True)), fields=['-created_at', '-id'], name='product_featured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_new_arrival', True)), fields=['-created_at', '-id'], name='product_new_arrival_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_best_seller', True)), fields=['-created_at', '-id'], name='product_best_seller_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_on_sale', True)), fields=['-discount_percentage', '-created_at', '-id'], name='product_on_sale_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:51
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_products(apps, schema_editor):
+    Category = apps.get_model('store', 'Category')
+    Product = apps.get_model('store', 'Product')
+
+    counts = (
+        Product.objects.filter(category=OuterRef('pk'))
+        .order_by()
+        .values('category')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    Category.objects.update(product_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_product_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+FTS_TABLE = 'store_product_fts'
+POSTGRES_INDEX = 'store_product_search_idx'
+
+
+def create_search_index(apps, schema_editor):
+    """
+    FTS5 table on SQLite (skipped if SQLite was built without FTS5), GIN index
+    matching store.search.PostgresSearchBackend.vector() on PostgreSQL
+    """
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                f"name, description, category, tokenize = 'porter unicode61 remove_diacritics 2')"
+            )
+        except OperationalError:
+            # No FTS5 in this SQLite build, search falls back to LIKE
+            return
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description, category) '
+            f'SELECT p.id, p.name, p.description, c.name '
+            f'FROM store_product p JOIN store_category c ON c.id = p.category_id'
+        )
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {POSTGRES_INDEX} ON store_product USING GIN (("
+            f"setweight(to_tsvector('english'::regconfig, COALESCE((name)::text, '')), 'A') || "
+            f"setweight(to_tsvector('english'::regconfig, COALESCE((description)::text, '')), 'B')"
+            f"))"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {POSTGRES_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_category_product_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
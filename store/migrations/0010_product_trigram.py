@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:04
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+POSTGRES_INDEXES = (
+    ('store_product_name_trgm_idx', 'store_product'),
+    ('store_category_name_trgm_idx', 'store_category'),
+)
+
+
+def trigrams(text):
+    # Same as store.fuzzy.trigrams()
+    grams = set()
+    for word in re.findall(r'\w+', (text or '').lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def create_trigram_index(apps, schema_editor):
+    """
+    pg_trgm and GIN trigram indexes on the names on PostgreSQL, the
+    ProductTrigram lookup table filled in everywhere else
+    """
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for index, table in POSTGRES_INDEXES:
+            schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {index} ON {table} USING GIN (name gin_trgm_ops)')
+        return
+
+    Product = apps.get_model('store', 'Product')
+    ProductTrigram = apps.get_model('store', 'ProductTrigram')
+    batch = []
+    for product_id, name, category_name in Product.objects.values_list('id', 'name', 'category__name').iterator():
+        batch.extend(
+            ProductTrigram(product_id=product_id, trigram=gram)
+            for gram in trigrams(name) | trigrams(category_name)
+        )
+        if len(batch) >= 5000:
+            ProductTrigram.objects.bulk_create(batch)
+            batch = []
+    ProductTrigram.objects.bulk_create(batch)
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for index, _ in POSTGRES_INDEXES:
+            schema_editor.execute(f'DROP INDEX IF EXISTS {index}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='store.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('trigram', 'product'), name='unique_product_trigram')],
+            },
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
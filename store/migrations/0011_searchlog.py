@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_product_trigram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query', models.CharField(blank=True, max_length=200)),
+                ('filters', models.JSONField(blank=True, default=dict)),
+                ('result_count', models.PositiveIntegerField()),
+                ('fuzzy', models.BooleanField(default=False)),
+                ('latency_ms', models.FloatField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_at'], name='store_searc_created_186408_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:15
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_items(apps, schema_editor):
+    """Fold repeated (cart, product) rows into the oldest one, quantities summed"""
+    CartItem = apps.get_model('store', 'CartItem')
+
+    duplicates = (
+        CartItem.objects.order_by()
+        .values('cart_id', 'product_id')
+        .annotate(rows=Count('id'), quantity=Sum('quantity'), keep=Min('id'))
+        .filter(rows__gt=1)
+    )
+    for row in duplicates:
+        CartItem.objects.filter(pk=row['keep']).update(quantity=row['quantity'])
+        CartItem.objects.filter(
+            cart_id=row['cart_id'], product_id=row['product_id'],
+        ).exclude(pk=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_searchlog'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='unique_cart_product'),
+        ),
+    ]
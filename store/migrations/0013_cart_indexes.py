@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_cartitem_unique_cart_product'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['session_id'], name='store_cart_session_046a48_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['updated_at'], name='store_cart_updated_08faa2_idx'),
+        ),
+    ]
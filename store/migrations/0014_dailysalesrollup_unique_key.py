@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:47
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_rows(apps, schema_editor):
+    """Fold rollup rows sharing a key into the oldest one, amounts summed"""
+    DailySalesRollup = apps.get_model('store', 'DailySalesRollup')
+
+    for rows, key in (
+        (DailySalesRollup.objects.filter(product__isnull=False), ('date', 'status', 'product_id')),
+        (DailySalesRollup.objects.filter(product__isnull=True), ('date', 'status', 'product_name')),
+    ):
+        duplicates = (
+            rows.order_by()
+            .values(*key)
+            .annotate(
+                rows=Count('id'), keep=Min('id'),
+                revenue=Sum('revenue'), units=Sum('units'), order_count=Sum('order_count'),
+            )
+            .filter(rows__gt=1)
+        )
+        for row in duplicates:
+            rows.filter(pk=row['keep']).update(
+                revenue=row['revenue'], units=row['units'], order_count=row['order_count'],
+            )
+            rows.filter(**{name: row[name] for name in key}).exclude(pk=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_cart_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailysalesrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('product__isnull', False)), fields=('date', 'status', 'product'), name='unique_rollup_product'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailysalesrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('product__isnull', True)), fields=('date', 'status', 'product_name'), name='unique_rollup_name'),
+        ),
+    ]
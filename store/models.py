@@ -1,7 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.utils.text import slugify
 from django.urls import reverse
+from django.utils import timezone
 from decimal import Decimal
 
 class Category(models.Model):
@@ -9,6 +10,8 @@ class Category(models.Model):
     slug = models.SlugField(unique=True, blank=True)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
+    # Maintained by store.signals, store.catalog.reconcile_category_counts() repairs it
+    product_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -35,9 +38,18 @@ class Category(models.Model):
     
     def get_absolute_url(self):
         return reverse('category_detail', kwargs={'category_slug': self.slug})
+
+class ProductQuerySet(models.QuerySet):
+    CARD_FIELDS = (
+        'id', 'name', 'slug', 'description', 'price', 'sale_price', 'stock',
+        'image', 'model_3d', 'is_featured', 'is_new_arrival', 'is_best_seller',
+        'is_on_sale', 'discount_percentage', 'created_at', 'updated_at',
+        'category__id', 'category__name', 'category__slug', 'category__updated_at',
+    )
     
-    def product_count(self):
-        return self.products.count()
+    def for_cards(self):
+        """Products with just what a product card renders, category included"""
+        return self.select_related('category').only(*self.CARD_FIELDS)
 
 class Product(models.Model):
     category = models.ForeignKey(Category, related_name='products', on_delete=models.CASCADE)
@@ -57,8 +69,31 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ProductQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        # One index per listing, matching its filter and (created_at, id) keyset order
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='product_created_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='product_category_created_idx'),
+            models.Index(
+                fields=['-created_at', '-id'], name='product_featured_idx',
+                condition=models.Q(is_featured=True),
+            ),
+            models.Index(
+                fields=['-created_at', '-id'], name='product_new_arrival_idx',
+                condition=models.Q(is_new_arrival=True),
+            ),
+            models.Index(
+                fields=['-created_at', '-id'], name='product_best_seller_idx',
+                condition=models.Q(is_best_seller=True),
+            ),
+            models.Index(
+                fields=['-discount_percentage', '-created_at', '-id'], name='product_on_sale_idx',
+                condition=models.Q(is_on_sale=True),
+            ),
+        ]
     
     def __str__(self):
         return self.name
@@ -101,23 +136,162 @@ class Product(models.Model):
         from django.utils import timezone
         import datetime
         return (timezone.now() - datetime.timedelta(days=30)) <= self.created_at
+    
+    def card_version(self):
+        """Changes whenever the product's card would render differently, used to key the card cache"""
+        return f'{self.pk}:{self.updated_at.timestamp()}:{self.category.updated_at.timestamp()}:{self.is_new()}'
+
+def display_price(prefix=''):
+    """Product.get_display_price() as an expression, prefix being the path to the product"""
+    return models.Case(
+        models.When(
+            models.Q(**{f'{prefix}is_on_sale': True, f'{prefix}sale_price__isnull': False}),
+            then=models.F(f'{prefix}sale_price'),
+        ),
+        default=models.F(f'{prefix}price'),
+    )
+
+class ProductTrigram(models.Model):
+    """
+    One row per distinct trigram of a product's name and category name, the
+    lookup table behind fuzzy search (store.fuzzy). Maintained by
+    store.signals, and left empty on PostgreSQL where pg_trgm is used.
+    """
+    trigram = models.CharField(max_length=3)
+    product = models.ForeignKey(Product, related_name='trigrams', on_delete=models.CASCADE)
+    
+    class Meta:
+        # Also the index fuzzy search reads, trigram first
+        constraints = [
+            models.UniqueConstraint(fields=['trigram', 'product'], name='unique_product_trigram'),
+        ]
+    
+    def __str__(self):
+        return f"{self.trigram!r} in {self.product_id}"
+
+class SearchLog(models.Model):
+    """One call of the search_results view, written in batches by store.searchlog"""
+    query = models.CharField(max_length=200, blank=True)  # normalized, see store.search_cache
+    filters = models.JSONField(default=dict, blank=True)
+    result_count = models.PositiveIntegerField()
+    fuzzy = models.BooleanField(default=False)
+    latency_ms = models.FloatField()
+    # Set when the search runs rather than when its batch is written
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.query!r}: {self.result_count} results in {self.latency_ms:.0f}ms"
+
+# Sum of the cart items' subtotals, over a Cart.items queryset. Some
+# databases return more decimal places than asked for, totals are rounded
+# to the cent.
+CENT = Decimal('0.01')
+CART_TOTAL = models.Sum(
+    models.F('quantity') * display_price('product__'),
+    output_field=models.DecimalField(max_digits=12, decimal_places=2),
+)
 
 class Cart(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
     session_id = models.CharField(max_length=255, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped by every change to the items too, see touch()
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['session_id']),
+            # For the purge_abandoned_carts command
+            models.Index(fields=['updated_at']),
+        ]
+    
     def __str__(self):
         if self.user:
             return f"Cart #{self.id} - {self.user.username}"
         return f"Cart #{self.id} - Anonymous"
     
     def total(self):
-        return sum(item.subtotal() for item in self.items.all())
+        total = self.items.aggregate(total=CART_TOTAL)['total'] or 0
+        return Decimal(total).quantize(CENT)
     
     def item_count(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.items.aggregate(item_count=models.Sum('quantity'))['item_count'] or 0
+    
+    def summary(self):
+        """Total and unit count together, from a single aggregate query"""
+        totals = self.items.aggregate(total=CART_TOTAL, item_count=models.Sum('quantity'))
+        return {
+            'total': Decimal(totals['total'] or 0).quantize(CENT),
+            'item_count': totals['item_count'] or 0,
+        }
+    
+    # The methods below are shared with store.carts.CachedCart, so views work
+    # with either kind of cart
+    
+    def line_items(self):
+        return self.items.select_related('product')
+    
+    def get_item(self, item_id):
+        """The item with this id if it is in this cart, else None"""
+        return self.items.select_related('product').filter(pk=item_id).first()
+    
+    def add_product(self, product, quantity=1):
+        item, created = CartItem.objects.get_or_create(
+            cart=self,
+            product=product,
+            defaults={'quantity': quantity},
+        )
+        # If it already exists, update the quantity instead
+        if not created:
+            item.quantity += quantity
+            item.save()
+        self.touch()
+        return item
+    
+    def set_quantity(self, item, quantity):
+        item.quantity = quantity
+        item.save()
+        self.touch()
+    
+    def remove_item(self, item):
+        item.delete()
+        self.touch()
+    
+    def touch(self):
+        """Mark the cart as in use, so it is not purged as abandoned"""
+        self.updated_at = timezone.now()
+        Cart.objects.filter(pk=self.pk).update(updated_at=self.updated_at)
+    
+    def add_quantities(self, quantities):
+        """
+        Add {product_id: quantity} to the cart, e.g. when claiming an
+        anonymous cart, writing the new quantities with one bulk upsert
+        """
+        product_ids = Product.objects.filter(pk__in=quantities).values_list('pk', flat=True)
+        quantities = {product_id: quantities[product_id] for product_id in product_ids}
+        current = dict(self.items.filter(product_id__in=quantities).values_list('product_id', 'quantity'))
+        CartItem.objects.bulk_create(
+            [
+                CartItem(cart=self, product_id=product_id, quantity=current.get(product_id, 0) + quantity)
+                for product_id, quantity in quantities.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity', 'updated_at'],
+        )
+        self.touch()
+    
+    def merge(self, other):
+        """Move the items of other, an anonymous cart, into this cart and delete it"""
+        with transaction.atomic():
+            self.add_quantities(dict(other.items.values_list('product_id', 'quantity')))
+            other.delete()
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
@@ -126,11 +300,16 @@ class CartItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
+    
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
     
     def subtotal(self):
-        return self.product.price * self.quantity
+        return self.product.get_display_price() * self.quantity
 
 class Order(models.Model):
     STATUS_CHOICES = (
@@ -163,6 +342,10 @@ class Order(models.Model):
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
+    # Product and category are captured at checkout; the name and price below
+    # remain the record of what was sold if the product is later changed or deleted
+    product = models.ForeignKey(Product, related_name='order_items', on_delete=models.SET_NULL, null=True, blank=True)
+    category = models.ForeignKey(Category, related_name='order_items', on_delete=models.SET_NULL, null=True, blank=True)
     product_name = models.CharField(max_length=200)
     product_price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.PositiveIntegerField(default=1)
@@ -171,6 +354,53 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.quantity} x {self.product_name}"
 
+class DailySalesRollupQuerySet(models.QuerySet):
+    def order_totals(self):
+        """Rows holding whole-order totals per (date, status)"""
+        return self.filter(product_name='')
+    
+    def product_totals(self):
+        """Rows breaking revenue down per product"""
+        return self.exclude(product_name='')
+
+class DailySalesRollup(models.Model):
+    """
+    Per-day sales totals, maintained from Order/OrderItem by store.rollups.
+
+    Rows with an empty product_name hold order totals for a (date, status)
+    pair; all other rows hold the revenue of a single product on that day.
+    """
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    category = models.ForeignKey(Category, related_name='+', on_delete=models.SET_NULL, null=True, blank=True)
+    product = models.ForeignKey(Product, related_name='+', on_delete=models.SET_NULL, null=True, blank=True)
+    product_name = models.CharField(max_length=200, blank=True)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    units = models.PositiveIntegerField(default=0)
+    order_count = models.PositiveIntegerField(default=0)
+    
+    objects = DailySalesRollupQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['date']
+        indexes = [
+            models.Index(fields=['date', 'status']),
+        ]
+        # One row per key, store.rollups adds to it from concurrent checkouts
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'status', 'product'], name='unique_rollup_product',
+                condition=models.Q(product__isnull=False),
+            ),
+            models.UniqueConstraint(
+                fields=['date', 'status', 'product_name'], name='unique_rollup_name',
+                condition=models.Q(product__isnull=True),
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} {self.status} {self.product_name or 'orders'}: {self.revenue}"
+
 class Wishlist(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
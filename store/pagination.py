@@ -0,0 +1,169 @@
+"""
+Keyset (cursor) pagination for product listings.
+
+Instead of OFFSET, each page remembers the sort key of its first and last row
+and the next page is fetched with a WHERE clause on those keys, so any page
+costs one indexed range scan no matter how deep it is.
+"""
+import base64
+import binascii
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from .catalog import catalog_version
+
+PRODUCTS_PER_PAGE = 24
+PAGE_CACHE_TIMEOUT = 5 * 60
+
+
+class KeysetPage:
+    """A page of results plus the cursors leading to its neighbours"""
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.next_query = ''
+        self.previous_query = ''
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset on a unique ordering, e.g. ('-created_at', '-id').
+
+    The last field must be unique (normally the primary key) so every row has
+    a distinct position.
+    """
+
+    def __init__(self, queryset, ordering=('-created_at', '-id'), per_page=PRODUCTS_PER_PAGE):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.fields = []
+        for name in ordering:
+            descending = name.startswith('-')
+            self.fields.append((name.lstrip('-'), descending))
+
+    def encode_cursor(self, direction, obj):
+        # value_to_string() keeps datetimes to the microsecond, a cursor
+        # rounded off would point before the row it was taken from
+        model = self.queryset.model
+        values = [model._meta.get_field(name).value_to_string(obj) for name, _ in self.fields]
+        data = json.dumps([direction, values])
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Return (direction, values) for a cursor, or None if it is not valid"""
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, values = json.loads(data)
+            if direction not in ('next', 'previous') or len(values) != len(self.fields):
+                return None
+            model = self.queryset.model
+            values = [
+                model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self.fields, values)
+            ]
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            return None
+        return direction, values
+
+    def after(self, values, reverse=False):
+        """Filter for rows positioned after the given key (before it if reverse)"""
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.fields, values):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+
+        # Redundant bound on the leading column, which lets the database seek
+        # straight to the cursor in an index instead of scanning up to it
+        name, descending = self.fields[0]
+        lookup = 'lte' if descending != reverse else 'gte'
+        return Q(**{f'{name}__{lookup}': values[0]}) & condition
+
+    def ordering(self, reverse=False):
+        return [
+            f'-{name}' if descending != reverse else name
+            for name, descending in self.fields
+        ]
+
+    def page_queryset(self, values=None, reverse=False):
+        """The rows of the page after the given key (before it if reverse), plus one"""
+        queryset = self.queryset.order_by(*self.ordering(reverse))
+        if values is not None:
+            queryset = queryset.filter(self.after(values, reverse))
+        return queryset[:self.per_page + 1]
+
+    def page(self, cursor=None):
+        decoded = self.decode_cursor(cursor) if cursor else None
+        direction, values = decoded or ('next', None)
+        reverse = direction == 'previous'
+
+        rows = list(self.page_queryset(values, reverse))
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        return KeysetPage(
+            rows,
+            has_next=has_next,
+            has_previous=has_previous,
+            next_cursor=self.encode_cursor('next', rows[-1]) if has_next and rows else None,
+            previous_cursor=self.encode_cursor('previous', rows[0]) if has_previous and rows else None,
+        )
+
+
+def paginate_products(request, queryset, listing, ordering=('-created_at', '-id')):
+    """
+    Return the requested page of a product listing.
+
+    Pages are cached per listing and cursor until the catalog changes, so
+    popular pages cost no queries at all.
+    """
+    cursor = request.GET.get('cursor', '')
+    cursor_hash = hashlib.md5(cursor.encode()).hexdigest()
+    key = f'store:listing:{catalog_version()}:{listing}:{cursor_hash}'
+    page = cache.get(key)
+    if page is None:
+        page = KeysetPaginator(queryset, ordering).page(cursor)
+        cache.set(key, page, PAGE_CACHE_TIMEOUT)
+
+    # Keep any other query parameters when moving between pages
+    params = request.GET.copy()
+    if page.next_cursor:
+        params['cursor'] = page.next_cursor
+        page.next_query = params.urlencode()
+    if page.previous_cursor:
+        params['cursor'] = page.previous_cursor
+        page.previous_query = params.urlencode()
+    return page
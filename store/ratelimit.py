@@ -0,0 +1,23 @@
+"""
+Fixed-window rate limiting on top of the Django cache.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def is_rate_limited(request, scope, limit, window):
+    """
+    Count this request against its client address and return True once more
+    than limit requests were made in the current window of seconds
+    """
+    client = request.META.get('REMOTE_ADDR', '')
+    key = f'store:ratelimit:{scope}:{client}:{int(time.time() // window)}'
+    cache.add(key, 0, window)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # The window expired between add() and incr()
+        cache.set(key, 1, window)
+        count = 1
+    return count > limit
@@ -0,0 +1,342 @@
+"""
+Maintenance of the DailySalesRollup table.
+
+Orders and order items add their share to the rollup as they are created,
+changed or deleted (see store.signals), with F() updates made in the same
+transaction as the change. A checkout costs a few queries per item
+whatever the number of orders that day, and concurrent checkouts never
+overwrite each other's totals.
+
+refresh_days() rebuilds whole days from the raw Order/OrderItem rows, for
+the rebuild_sales_rollup command: backfills, and repairs after bulk
+QuerySet.update() calls that bypass the signals.
+"""
+import datetime
+import threading
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Max, Sum, Value, When
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+
+from .models import DailySalesRollup, Order, OrderItem
+
+# Groups order items or product rollup rows per product, and those whose
+# product was deleted per name (both models name the fields alike)
+ITEM_NAME_KEY = Case(When(product__isnull=True, then='product_name'), default=Value(''))
+
+_deleting = threading.local()
+
+
+def start_of_day(day):
+    """Aware datetime of midnight at the start of a date"""
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min), timezone.get_current_timezone())
+
+
+def day_bounds(start, end):
+    """Aware datetimes covering the dates in [start, end)"""
+    return start_of_day(start), start_of_day(end)
+
+
+def local_date(value):
+    return timezone.localtime(value).date()
+
+
+def refresh_days(start, end):
+    """Rebuild the rollup rows for the dates in [start, end)"""
+    start_at, end_at = day_bounds(start, end)
+
+    order_rows = (
+        Order.objects.filter(created_at__gte=start_at, created_at__lt=end_at)
+        .annotate(date=TruncDate('created_at'))
+        .values('date', 'status')
+        .annotate(revenue=Sum('total'), order_count=Count('id'))
+        .order_by()
+    )
+    item_rows = (
+        OrderItem.objects.filter(order__created_at__gte=start_at, order__created_at__lt=end_at)
+        .annotate(date=TruncDate('order__created_at'), name_key=ITEM_NAME_KEY)
+        .values('date', 'order__status', 'product_id', 'name_key')
+        .annotate(
+            name=Max('product_name'),
+            category=Max('category_id'),
+            revenue=Sum('subtotal'),
+            units=Sum('quantity'),
+            order_count=Count('order', distinct=True),
+        )
+        .order_by()
+    )
+
+    with transaction.atomic():
+        units_by_day = {}
+        rollups = []
+        for row in item_rows:
+            key = (row['date'], row['order__status'])
+            units_by_day[key] = units_by_day.get(key, 0) + row['units']
+            rollups.append(DailySalesRollup(
+                date=row['date'],
+                status=row['order__status'],
+                product_id=row['product_id'],
+                category_id=row['category'],
+                product_name=row['name'],
+                revenue=row['revenue'] or 0,
+                units=row['units'],
+                order_count=row['order_count'],
+            ))
+
+        for row in order_rows:
+            rollups.append(DailySalesRollup(
+                date=row['date'],
+                status=row['status'],
+                revenue=row['revenue'] or 0,
+                units=units_by_day.get((row['date'], row['status']), 0),
+                order_count=row['order_count'],
+            ))
+
+        DailySalesRollup.objects.filter(date__gte=start, date__lt=end).delete()
+        DailySalesRollup.objects.bulk_create(rollups, batch_size=500)
+
+    return len(rollups)
+
+
+def add_to_rollup(date, status, revenue=0, units=0, order_count=0,
+                  product_id=None, product_name='', category_id=None):
+    """
+    Add the given amounts, negative to take them away, to the rollup row of
+    (date, status) and a product, or to the order totals row when no
+    product is given. A row left without orders is deleted.
+    """
+    if product_id is not None:
+        key = {'product_id': product_id}
+        defaults = {'product_name': product_name}
+    else:
+        key = {'product': None, 'product_name': product_name}
+        defaults = {}
+
+    if revenue >= 0 and units >= 0 and order_count >= 0:
+        # The unique constraints on the key let a concurrent insert of the
+        # same row fail and be read back rather than duplicated
+        row, created = DailySalesRollup.objects.get_or_create(
+            date=date, status=status, **key,
+            defaults=dict(defaults, revenue=revenue, units=units, order_count=order_count, category_id=category_id),
+        )
+        if created:
+            return
+        pk = row.pk
+    else:
+        pk = DailySalesRollup.objects.filter(date=date, status=status, **key).values_list('pk', flat=True).first()
+        if pk is None:
+            # With nothing to take away from, the day was never rolled up
+            return
+
+    updated = DailySalesRollup.objects.filter(pk=pk).update(
+        revenue=F('revenue') + revenue,
+        # A row out of step must not break the order save with a negative count
+        units=Greatest(F('units') + units, 0),
+        order_count=Greatest(F('order_count') + order_count, 0),
+    )
+    if not updated:
+        # Deleted by another writer in the meantime
+        return add_to_rollup(date, status, revenue, units, order_count, product_id, product_name, category_id)
+    if order_count < 0:
+        DailySalesRollup.objects.filter(pk=pk, order_count=0).delete()
+
+
+def order_item_values(item):
+    """What an order item adds to the rollup, as read by add_order_item()"""
+    return {
+        'id': item.pk,
+        'order_id': item.order_id,
+        'product_id': item.product_id,
+        'category_id': item.category_id,
+        'product_name': item.product_name,
+        'subtotal': item.subtotal,
+        'quantity': item.quantity,
+    }
+
+
+def add_order_item(item, date, status, sign=1):
+    """
+    Add an order item, as order_item_values(), to the rollup of its order's
+    date and status, or take it away with sign=-1. The product row counts
+    the order once, however many of its items are for the product.
+    """
+    if item['product_id'] is not None:
+        product = {'product_id': item['product_id']}
+    else:
+        product = {'product__isnull': True, 'product_name': item['product_name']}
+    other_items = OrderItem.objects.filter(order_id=item['order_id'], **product).exclude(pk=item['id'])
+
+    add_to_rollup(
+        date, status,
+        revenue=sign * item['subtotal'],
+        units=sign * item['quantity'],
+        order_count=0 if other_items.exists() else sign,
+        product_id=item['product_id'],
+        product_name=item['product_name'],
+        category_id=item['category_id'],
+    )
+    add_to_rollup(date, status, units=sign * item['quantity'])
+
+
+def same_product(item, other):
+    if item['product_id'] is not None or other['product_id'] is not None:
+        return item['product_id'] == other['product_id']
+    return item['product_name'] == other['product_name']
+
+
+def order_item_before_save(item):
+    """The values order_item_saved() needs of an order item about to be saved"""
+    previous = OrderItem.objects.select_related('order').filter(pk=item.pk).first() if item.pk else None
+    if previous is None:
+        return None
+    return dict(
+        order_item_values(previous),
+        date=local_date(previous.order.created_at),
+        status=previous.order.status,
+    )
+
+
+def order_item_saved(item, previous):
+    """
+    Update the rollup for a created or changed order item, previous being
+    its order_item_values() with 'date' and 'status' of its order before
+    the save, or None for a new item
+    """
+    values = order_item_values(item)
+    date, status = local_date(item.order.created_at), item.order.status
+    if previous is None:
+        add_order_item(values, date, status)
+    elif (
+        (previous['order_id'], previous['date'], previous['status']) == (values['order_id'], date, status)
+        and same_product(previous, values)
+    ):
+        add_to_rollup(
+            date, status,
+            revenue=values['subtotal'] - previous['subtotal'],
+            units=values['quantity'] - previous['quantity'],
+            product_id=values['product_id'],
+            product_name=values['product_name'],
+        )
+        add_to_rollup(date, status, units=values['quantity'] - previous['quantity'])
+    else:
+        add_order_item(previous, previous['date'], previous['status'], sign=-1)
+        add_order_item(values, date, status)
+
+
+def order_item_deleted(item):
+    if item.order_id in deleting_orders():
+        # Taken out with its order by order_before_delete()
+        return
+    add_order_item(order_item_values(item), local_date(item.order.created_at), item.order.status, sign=-1)
+
+
+def order_before_save(order):
+    """The values order_saved() needs of an order about to be saved"""
+    if not order.pk:
+        return None
+    return Order.objects.filter(pk=order.pk).values('created_at', 'status', 'total').first()
+
+
+def order_saved(order, previous):
+    """
+    Update the rollup for a created or changed order, previous being the
+    order's created_at, status and total before the save, or None for a new
+    order. Its items are added as they are created.
+    """
+    date = local_date(order.created_at)
+    if previous is None:
+        add_to_rollup(date, order.status, revenue=order.total, order_count=1)
+        return
+
+    previous_date = local_date(previous['created_at'])
+    if (previous_date, previous['status']) != (date, order.status):
+        move_order(order, previous_date, previous['status'], previous['total'])
+    elif order.total != previous['total']:
+        add_to_rollup(date, order.status, revenue=order.total - previous['total'])
+
+
+def deleting_orders():
+    """Ids of the orders this thread is deleting, whose items follow them out"""
+    if not hasattr(_deleting, 'order_ids'):
+        _deleting.order_ids = set()
+    return _deleting.order_ids
+
+
+def order_before_delete(order):
+    """
+    Take an order and its items out of the rollup before the delete cascades
+    to the items, each product counted once however many lines it has
+    """
+    date = local_date(order.created_at)
+    items = order_product_totals(order)
+    add_to_rollup(date, order.status, revenue=-order.total, units=-sum(row['units'] for row in items), order_count=-1)
+    for row in items:
+        add_to_rollup(date, order.status, revenue=-row['revenue'], units=-row['units'], order_count=-1, **row['product'])
+    deleting_orders().add(order.pk)
+
+
+def order_deleted(order):
+    deleting_orders().discard(order.pk)
+
+
+def order_product_totals(order):
+    """The revenue and units of an order per product, keyed as the rollup rows"""
+    rows = (
+        order.items.annotate(name_key=ITEM_NAME_KEY)
+        .values('product_id', 'name_key')
+        .annotate(
+            name=Max('product_name'),
+            category=Max('category_id'),
+            revenue=Sum('subtotal'),
+            units=Sum('quantity'),
+        )
+        .order_by()
+    )
+    return [
+        {
+            'product': {'product_id': row['product_id'], 'product_name': row['name'], 'category_id': row['category']},
+            'revenue': row['revenue'],
+            'units': row['units'],
+        }
+        for row in rows
+    ]
+
+
+def move_order(order, old_date, old_status, old_total):
+    """Move an order and its items to the rollup of its new date or status"""
+    date = local_date(order.created_at)
+    items = order_product_totals(order)
+    units = sum(row['units'] for row in items)
+
+    add_to_rollup(old_date, old_status, revenue=-old_total, units=-units, order_count=-1)
+    add_to_rollup(date, order.status, revenue=order.total, units=units, order_count=1)
+    for row in items:
+        add_to_rollup(old_date, old_status, revenue=-row['revenue'], units=-row['units'], order_count=-1, **row['product'])
+        add_to_rollup(date, order.status, revenue=row['revenue'], units=row['units'], order_count=1, **row['product'])
+
+
+def product_before_delete(product):
+    """
+    Turn the rollup rows of a product about to be deleted into rows per name,
+    as refresh_days() groups the items of deleted products
+    """
+    DailySalesRollup.objects.filter(product=product).delete()
+    rows = (
+        OrderItem.objects.filter(product=product)
+        .annotate(date=TruncDate('order__created_at'))
+        .values('date', 'order__status', 'product_name')
+        .annotate(
+            category=Max('category_id'),
+            revenue=Sum('subtotal'),
+            units=Sum('quantity'),
+            order_count=Count('order', distinct=True),
+        )
+        .order_by()
+    )
+    for row in rows:
+        add_to_rollup(
+            row['date'], row['order__status'],
+            revenue=row['revenue'], units=row['units'], order_count=row['order_count'],
+            product_name=row['product_name'], category_id=row['category'],
+        )
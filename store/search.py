@@ -0,0 +1,343 @@
+"""
+Pluggable product search.
+
+Backends, chosen with the STORE_SEARCH_BACKEND setting ('auto' by default):
+
+- 'fts5': an SQLite FTS5 table over product name, description and category
+  name, ranked with BM25.
+- 'postgres': a weighted SearchVector over name and description backed by a
+  GIN expression index, ranked with ts_rank.
+- 'memory': an inverted index held in each process (store.inverted_index),
+  for SQLite builds without FTS5.
+- 'like': case-insensitive LIKE scans, the fallback for other databases.
+
+'auto' picks the best backend the configured database supports. The FTS5
+table and the GIN index are created by migration 0009. The FTS5 table and the
+in-memory index are kept in step with products by store.signals and can be
+rebuilt from scratch with manage.py rebuild_search_index.
+"""
+import datetime
+import functools
+import json
+import re
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .catalog import catalog_version
+from .inverted_index import InvertedIndex
+from .models import Category, Product
+
+FTS_TABLE = 'store_product_fts'
+# BM25 weights of the name, description and category columns
+FTS_WEIGHTS = (10.0, 2.0, 5.0)
+POSTGRES_CONFIG = 'english'
+POSTGRES_INDEX = 'store_product_search_idx'
+# Weights of the name, category and description in the in-memory index
+MEMORY_WEIGHTS = (3, 2, 1)
+
+
+def search_terms(query):
+    """Lower-cased words of a query, punctuation dropped"""
+    return re.findall(r'\w+', query.lower())
+
+
+class LikeSearchBackend:
+    """Substring matches anywhere in name, description or category name"""
+    name = 'like'
+
+    def filter(self, queryset, query):
+        return queryset.filter(
+            Q(name__icontains=query) |
+            Q(description__icontains=query) |
+            Q(category__name__icontains=query)
+        )
+
+    def rank(self, query):
+        # Matches in the name count for more than matches in the category or description
+        return Case(
+            When(name__icontains=query, then=Value(3)),
+            When(category__name__icontains=query, then=Value(2)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+
+    def ranked_ids(self, queryset, query, offset, limit):
+        """Ids of a slice of queryset, the products matching query, best match first"""
+        ranked = queryset.annotate(search_rank=self.rank(query)).order_by(
+            F('search_rank').desc(nulls_last=True), '-created_at', '-id'
+        )
+        return list(ranked.values_list('id', flat=True)[offset:offset + limit])
+
+    def index_product(self, product):
+        pass
+
+    def remove_product(self, product_id):
+        pass
+
+    def index_category(self, category):
+        pass
+
+    def rebuild(self):
+        return 0
+
+
+class FTS5SearchBackend(LikeSearchBackend):
+    """SQLite FTS5 with the porter stemmer, every word of the query matched as a prefix"""
+    name = 'fts5'
+
+    def match_expression(self, query):
+        return ' '.join(f'"{term}"*' for term in search_terms(query))
+
+    def filter(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (match,))
+        )
+
+    def ranked_ids(self, queryset, query, offset, limit):
+        match = self.match_expression(query)
+        if not match:
+            return []
+        # The matches are scored once, in FROM, and joined to the products of
+        # queryset, whose own subqueries run once as well. bm25() is lower
+        # for better matches.
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        products, params = queryset.order_by().values('id').query.sql_with_params()
+        table = Product._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT p.id FROM ('
+                f'SELECT rowid, bm25({FTS_TABLE}, {weights}) AS score '
+                f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+                f') AS matches JOIN {table} p ON p.id = matches.rowid '
+                f'WHERE p.id IN ({products}) '
+                f'ORDER BY matches.score, p.created_at DESC, p.id DESC LIMIT %s OFFSET %s',
+                [match, *params, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def index_product(self, product):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product.pk])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description, category) VALUES (%s, %s, %s, %s)',
+                [product.pk, product.name, product.description, product.category.name],
+            )
+
+    def remove_product(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+
+    def index_category(self, category):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {FTS_TABLE} SET category = %s WHERE rowid IN '
+                f'(SELECT id FROM {Product._meta.db_table} WHERE category_id = %s)',
+                [category.name, category.pk],
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description, category) '
+                f'SELECT p.id, p.name, p.description, c.name '
+                f'FROM {Product._meta.db_table} p JOIN {Category._meta.db_table} c ON c.id = p.category_id'
+            )
+            return cursor.rowcount
+
+
+class PostgresSearchBackend(LikeSearchBackend):
+    """
+    Full-text search with PostgreSQL. The vector matches the GIN expression
+    index created by migration 0009, so searches are index scans.
+    """
+    name = 'postgres'
+
+    def vector(self):
+        from django.contrib.postgres.search import SearchVector
+
+        return (
+            SearchVector('name', weight='A', config=POSTGRES_CONFIG) +
+            SearchVector('description', weight='B', config=POSTGRES_CONFIG)
+        )
+
+    def search_query(self, query):
+        from django.contrib.postgres.search import SearchQuery
+
+        return SearchQuery(query, config=POSTGRES_CONFIG, search_type='websearch')
+
+    def filter(self, queryset, query):
+        categories = Category.objects.filter(name__icontains=query).values('id')
+        return queryset.annotate(search_vector=self.vector()).filter(
+            Q(search_vector=self.search_query(query)) | Q(category_id__in=categories)
+        )
+
+    def rank(self, query):
+        from django.contrib.postgres.search import SearchRank
+
+        return SearchRank(self.vector(), self.search_query(query))
+
+
+_product_index = None
+_product_index_lock = threading.Lock()
+# The last search of each thread, a search reads it for filters, counts and ranking
+_last_search = threading.local()
+
+
+def product_fields(name, description, category_name):
+    name_weight, category_weight, description_weight = MEMORY_WEIGHTS
+    return [(name, name_weight), (category_name, category_weight), (description, description_weight)]
+
+
+def load_product_index():
+    index = InvertedIndex()
+    index.synced_version = catalog_version()
+    index.synced_at = timezone.now()
+    rows = (
+        Product.objects.order_by('id')
+        .values_list('id', 'name', 'description', 'category__name')
+        .iterator(chunk_size=2000)
+    )
+    index.build((product_id, product_fields(*fields)) for product_id, *fields in rows)
+    return index
+
+
+def sync_product_index(index):
+    """
+    Catch up with products changed by other processes since the index was
+    last synced, which the catalog version tells us happened
+    """
+    version = catalog_version()
+    if version == index.synced_version:
+        return
+    started = timezone.now()
+    # Allow for writes that committed while the previous sync was running
+    since = index.synced_at - datetime.timedelta(seconds=5)
+
+    changed = Product.objects.filter(
+        Q(updated_at__gte=since) | Q(category__updated_at__gte=since)
+    ).values_list('id', 'name', 'description', 'category__name')
+    for product_id, *fields in changed:
+        index.add(product_id, product_fields(*fields))
+
+    if Product.objects.count() != len(index):
+        existing = set(Product.objects.values_list('id', flat=True))
+        for product_id in set(index.documents) - existing:
+            index.remove(product_id)
+
+    index.synced_version = version
+    index.synced_at = started
+
+
+def get_product_index():
+    """This process's index of all products, built on first use"""
+    global _product_index
+    with _product_index_lock:
+        if _product_index is None:
+            _product_index = load_product_index()
+        else:
+            sync_product_index(_product_index)
+        return _product_index
+
+
+def order_matches(scores, rows):
+    """
+    Ids of rows, (product id, created_at) pairs, best score first, then
+    newest, as the database backends order them
+    """
+    ranked = sorted(rows, key=lambda row: (scores.get(row[0], 0.0), row[1], row[0]), reverse=True)
+    return [product_id for product_id, _ in ranked]
+
+
+class InMemorySearchBackend(LikeSearchBackend):
+    """
+    Searches an inverted index held in memory, the product table is only
+    read to apply the other filters to the matching ids
+    """
+    name = 'memory'
+
+    def results(self, query):
+        """[(product_id, score)] of every match, best first, computed once per query and index change"""
+        index = get_product_index()
+        last = getattr(_last_search, 'key', None)
+        key = (id(index), index.generation, query)
+        if last != key:
+            _last_search.results = index.search(query)
+            _last_search.key = key
+        return _last_search.results
+
+    def filter(self, queryset, query):
+        ids = [product_id for product_id, _ in self.results(query)]
+        if connection.vendor == 'sqlite':
+            # One JSON parameter rather than one per id, however many match
+            return queryset.filter(id__in=RawSQL('SELECT value FROM json_each(%s)', (json.dumps(ids),)))
+        return queryset.filter(id__in=ids)
+
+    def ranked_ids(self, queryset, query, offset, limit):
+        scores = dict(self.results(query))
+        rows = queryset.order_by().values_list('id', 'created_at')
+        return order_matches(scores, rows)[offset:offset + limit]
+
+    def index_product(self, product):
+        # An index not built yet will read the product when it is
+        if _product_index is not None:
+            _product_index.add(product.pk, product_fields(product.name, product.description, product.category.name))
+
+    def remove_product(self, product_id):
+        if _product_index is not None:
+            _product_index.remove(product_id)
+
+    def index_category(self, category):
+        if _product_index is None:
+            return
+        rows = category.products.values_list('id', 'name', 'description')
+        for product_id, name, description in rows:
+            _product_index.add(product_id, product_fields(name, description, category.name))
+
+    def rebuild(self):
+        global _product_index
+        index = load_product_index()
+        with _product_index_lock:
+            _product_index = index
+        return len(index)
+
+
+SEARCH_BACKENDS = {
+    backend.name: backend
+    for backend in (LikeSearchBackend, FTS5SearchBackend, PostgresSearchBackend, InMemorySearchBackend)
+}
+
+
+@functools.lru_cache(maxsize=None)
+def fts5_table_exists():
+    return FTS_TABLE in connection.introspection.table_names()
+
+
+def get_search_backend():
+    name = getattr(settings, 'STORE_SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        if connection.vendor == 'postgresql':
+            name = 'postgres'
+        elif connection.vendor == 'sqlite':
+            name = 'fts5' if fts5_table_exists() else 'memory'
+        else:
+            name = 'like'
+    return SEARCH_BACKENDS[name]()
+
+
+def ranked_product_ids(queryset, query, offset, limit):
+    """Ids of a page of the products matching query, best match first"""
+    return get_search_backend().ranked_ids(queryset, query, offset, limit)
+
+
+def search_products(queryset, query):
+    """Restrict a product queryset to the products matching query"""
+    return get_search_backend().filter(queryset, query)
@@ -0,0 +1,146 @@
+"""
+Cached search result pages.
+
+A search is identified by its normalized parameters (query, category, price
+range, in stock, featured, sort and page). The cache holds only the ordered
+product ids of the page and the facet counts, so entries stay small, and
+keys include the catalog version so any product change invalidates them.
+Searches with few exact matches fall back on similar names (store.fuzzy).
+"""
+import hashlib
+
+from django.core.cache import cache
+
+from .catalog import catalog_version
+from .facets import facet_counts, parse_price
+from .fuzzy import FUZZY_MIN_RESULTS, rank_similar_products, similar_products, with_similar_products
+from .models import Category, Product
+from .search import ranked_product_ids, search_products
+
+SEARCH_SORTS = ('relevance', 'price_asc', 'price_desc', 'newest', 'popularity')
+SEARCH_RESULTS_PER_PAGE = 24
+SEARCH_CACHE_TIMEOUT = 10 * 60
+SEARCH_MAX_QUERY_LENGTH = 200
+
+
+def normalize_query(query):
+    """Lower case with runs of whitespace collapsed, searches differing only in those are the same"""
+    return ' '.join(query.lower().split())[:SEARCH_MAX_QUERY_LENGTH]
+
+
+def parse_page(value):
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def parse_search_params(params):
+    """Normalized search parameters from the query string"""
+    sort = params.get('sort', 'relevance')
+    return {
+        'query': normalize_query(params.get('q', '')),
+        'category': params.get('category', ''),
+        'min_price': parse_price(params.get('min_price')),
+        'max_price': parse_price(params.get('max_price')),
+        'in_stock': params.get('in_stock') == 'true',
+        'featured': params.get('featured') == 'true',
+        'sort': sort if sort in SEARCH_SORTS else 'relevance',
+        'page': parse_page(params.get('page')),
+    }
+
+
+def search_cache_key(params):
+    def normalized(value):
+        # 10 and 10.00 are the same price
+        return value.normalize() if hasattr(value, 'normalize') else value
+
+    values = tuple(normalized(params[name]) for name in sorted(params))
+    digest = hashlib.md5(repr(values).encode()).hexdigest()
+    return f'store:search:{catalog_version()}:{digest}'
+
+
+def run_search(params, per_page=SEARCH_RESULTS_PER_PAGE):
+    """
+    Return {'ids': [...], 'page': n, 'counts': facet counts, 'fuzzy': bool}
+    for a search, fuzzy telling whether similar products were added
+    """
+    products = Product.objects.all()
+    if params['query']:
+        products = search_products(products, params['query'])
+
+    category_id = None
+    if params['category']:
+        # An unknown slug matches no category (ids start at 1)
+        category_id = Category.objects.filter(slug=params['category']).values_list('id', flat=True).first() or 0
+
+    def counts_for(products):
+        return facet_counts(
+            products,
+            category_id=category_id,
+            min_price=params['min_price'],
+            max_price=params['max_price'],
+            in_stock=params['in_stock'],
+            featured=params['featured'],
+        )
+
+    counts = counts_for(products)
+
+    # Too few exact matches, most likely a typo: add products with similar names
+    exact = products
+    similar = []
+    if params['query'] and counts['total'] < FUZZY_MIN_RESULTS:
+        similar = similar_products(params['query'])
+        if similar:
+            products = with_similar_products(exact, similar)
+            counts = counts_for(products)
+
+    # Apply filters
+    if category_id is not None:
+        products = products.filter(category_id=category_id)
+    if params['min_price'] is not None:
+        products = products.filter(price__gte=params['min_price'])
+    if params['max_price'] is not None:
+        products = products.filter(price__lte=params['max_price'])
+    if params['in_stock']:
+        products = products.filter(stock__gt=0)
+    if params['featured']:
+        products = products.filter(is_featured=True)
+
+    # Apply sorting
+    sort = params['sort']
+    ranked = params['query'] and sort == 'relevance' and not similar
+    if similar and sort == 'relevance':
+        products = rank_similar_products(products, exact, similar)
+    elif sort == 'price_asc':
+        products = products.order_by('price', 'id')
+    elif sort == 'price_desc':
+        products = products.order_by('-price', 'id')
+    elif sort == 'newest':
+        products = products.order_by('-created_at', '-id')
+    elif sort == 'popularity':
+        # This is a placeholder for popularity - in a real app you might use
+        # order count or views as a measure of popularity
+        products = products.order_by('-is_featured', '-created_at', '-id')
+
+    # Pages past the end show the last page
+    last_page = max((counts['total'] + per_page - 1) // per_page, 1)
+    page = min(params['page'], last_page)
+    offset = (page - 1) * per_page
+    if ranked:
+        # Backends rank a page of matches their own way, see store.search
+        ids = ranked_product_ids(products, params['query'], offset, per_page)
+    else:
+        ids = list(products.values_list('id', flat=True)[offset:offset + per_page])
+
+    return {'ids': ids, 'page': page, 'counts': counts, 'fuzzy': bool(similar)}
+
+
+def get_search_page(params):
+    """run_search() through the cache"""
+    key = search_cache_key(params)
+    result = cache.get(key)
+    if result is None:
+        result = run_search(params)
+        cache.set(key, result, SEARCH_CACHE_TIMEOUT)
+    return result
@@ -0,0 +1,107 @@
+"""
+Search analytics, the SearchLog rows behind the staff search report.
+
+Writing a row per search would add an INSERT to every search request.
+Instead entries are collected in a per-process buffer and written with a
+single bulk_create once SEARCH_LOG_BATCH_SIZE have piled up, or at the
+latest SEARCH_LOG_FLUSH_INTERVAL seconds after the first of them, from a
+timer thread. What is still buffered is written when the process exits; a
+process that is killed loses at most one batch, acceptable for analytics.
+"""
+import atexit
+import logging
+import threading
+
+from django.db import DatabaseError, connections
+
+from .models import SearchLog
+
+SEARCH_LOG_BATCH_SIZE = 50
+SEARCH_LOG_FLUSH_INTERVAL = 10
+
+logger = logging.getLogger(__name__)
+
+
+class SearchLogBuffer:
+    def __init__(self, batch_size=SEARCH_LOG_BATCH_SIZE, flush_interval=SEARCH_LOG_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.entries = []
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, entry):
+        with self.lock:
+            self.entries.append(entry)
+            if len(self.entries) < self.batch_size:
+                if self.timer is None:
+                    self.timer = threading.Timer(self.flush_interval, self.flush_from_timer)
+                    self.timer.daemon = True
+                    self.timer.start()
+                return
+            entries = self.take()
+        self.write(entries)
+
+    def take(self):
+        """Empty the buffer, the caller holds the lock"""
+        entries, self.entries = self.entries, []
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        return entries
+
+    def flush(self):
+        with self.lock:
+            entries = self.take()
+        self.write(entries)
+
+    def flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            # The timer thread's connection would otherwise stay open
+            connections.close_all()
+
+    def write(self, entries):
+        if not entries:
+            return
+        try:
+            SearchLog.objects.bulk_create(entries)
+        except DatabaseError:
+            logger.exception('Dropped %d search log entries', len(entries))
+
+
+_buffer = SearchLogBuffer()
+atexit.register(_buffer.flush)
+
+
+def search_filters(params):
+    """The filters of normalized search parameters that differ from the defaults"""
+    filters = {}
+    for name in ('category', 'min_price', 'max_price', 'in_stock', 'featured'):
+        if params[name] not in (None, '', False):
+            filters[name] = str(params[name]) if name.endswith('_price') else params[name]
+    if params['sort'] != 'relevance':
+        filters['sort'] = params['sort']
+    if params['page'] != 1:
+        filters['page'] = params['page']
+    return filters
+
+
+def log_search(params, result_count, seconds, fuzzy=False):
+    """Record a search, params as returned by store.search_cache.parse_search_params()"""
+    _buffer.add(SearchLog(
+        query=params['query'],
+        filters=search_filters(params),
+        result_count=result_count,
+        fuzzy=fuzzy,
+        latency_ms=seconds * 1000,
+    ))
+
+
+def flush_search_log():
+    """Write out buffered entries now, e.g. before reading the log"""
+    _buffer.flush()
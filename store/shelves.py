@@ -0,0 +1,68 @@
+"""
+Product shelves for the home page.
+
+All shelves are read in a single query that ranks flagged products within
+each flag and keeps the newest few of each, then split up in Python. The
+result is cached under the catalog version, so it is rebuilt only after a
+product or category changes.
+"""
+from django.core.cache import cache
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .catalog import catalog_version
+from .models import Category, Product
+
+SHELF_SIZE = 8
+HOME_CATEGORY_COUNT = 6
+SHELF_CACHE_TIMEOUT = 24 * 60 * 60
+
+# (context name, product flag) for each shelf, in page order
+SHELVES = (
+    ('featured_products', 'is_featured'),
+    ('new_products', 'is_new_arrival'),
+    ('best_sellers', 'is_best_seller'),
+    ('on_sale_products', 'is_on_sale'),
+)
+
+
+def build_shelves(size=SHELF_SIZE):
+    """Return {shelf name: [products]} for every shelf, newest first"""
+    flagged = Q()
+    within_shelf = Q()
+    ranks = {}
+    for _, flag in SHELVES:
+        flagged |= Q(**{flag: True})
+        within_shelf |= Q(**{flag: True, f'{flag}_rank__lte': size})
+        ranks[f'{flag}_rank'] = Window(
+            RowNumber(),
+            partition_by=F(flag),
+            order_by=[F('created_at').desc(), F('id').desc()],
+        )
+
+    products = (
+        Product.objects.for_cards()
+        .filter(flagged)
+        .annotate(**ranks)
+        .filter(within_shelf)
+        .order_by('-created_at', '-id')
+    )
+
+    shelves = {name: [] for name, _ in SHELVES}
+    for product in products:
+        for name, flag in SHELVES:
+            if getattr(product, flag) and getattr(product, f'{flag}_rank') <= size:
+                shelves[name].append(product)
+    return shelves
+
+
+def build_home_page():
+    home = build_shelves()
+    home['categories'] = list(Category.objects.all()[:HOME_CATEGORY_COUNT])
+    return home
+
+
+def get_home_page():
+    """Shelves and categories for the home page, from the cache when possible"""
+    key = f'store:home:{catalog_version()}'
+    return cache.get_or_set(key, build_home_page, SHELF_CACHE_TIMEOUT)
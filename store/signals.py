@@ -1,10 +1,153 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.db import transaction
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile
+from django.contrib.auth.signals import user_logged_in
+from .models import UserProfile, Order, OrderItem, Product, Category
+from .rollups import (
+    order_before_delete, order_before_save, order_deleted, order_item_before_save, order_item_deleted,
+    order_item_saved, order_saved, product_before_delete,
+)
+from .catalog import adjust_product_count, bump_catalog_version
+from .search import get_search_backend
+from .fuzzy import index_category_trigrams, index_product_trigrams
+from .carts import forget_cart_count, get_cart_backend
+from .suggest import add_suggestion, remove_suggestion
+from .analytics import invalidate_chart_data
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     """Create a user profile when a new user is created"""
     if created:
-        UserProfile.objects.create(user=instance)
\ No newline at end of file
+        UserProfile.objects.create(user=instance)
+
+@receiver(user_logged_in)
+def claim_anonymous_cart(sender, request, user, **kwargs):
+    """Carry what the visitor put in their cart before logging in over to their account"""
+    if request is not None:
+        get_cart_backend().claim_cart(request, user)
+
+@receiver(user_logged_in)
+def reset_cart_count(sender, request, user, **kwargs):
+    """The session's badge count was for the anonymous cart, not the user's"""
+    if request is not None:
+        forget_cart_count(request)
+
+@receiver(pre_save, sender=Order)
+def remember_order_rollup(sender, instance, **kwargs):
+    """Note the date, status and total an order was rolled up under"""
+    instance._previous_rollup = order_before_save(instance)
+
+@receiver(post_save, sender=Order)
+def update_order_rollup(sender, instance, **kwargs):
+    """Keep the daily sales rollup in step with created and updated orders"""
+    order_saved(instance, getattr(instance, '_previous_rollup', None))
+
+@receiver(pre_delete, sender=Order)
+def remove_order_rollup(sender, instance, **kwargs):
+    """Take a deleted order out of the rollup, its items included"""
+    order_before_delete(instance)
+
+@receiver(post_delete, sender=Order)
+def forget_deleted_order(sender, instance, **kwargs):
+    order_deleted(instance)
+
+@receiver(pre_save, sender=OrderItem)
+def remember_order_item_rollup(sender, instance, **kwargs):
+    instance._previous_rollup = order_item_before_save(instance)
+
+@receiver(post_save, sender=OrderItem)
+def update_order_item_rollup(sender, instance, **kwargs):
+    """Order items edited after checkout (e.g. in the admin) change their day's totals"""
+    order_item_saved(instance, getattr(instance, '_previous_rollup', None))
+
+@receiver(post_delete, sender=OrderItem)
+def remove_order_item_rollup(sender, instance, **kwargs):
+    order_item_deleted(instance)
+
+@receiver(pre_delete, sender=Product)
+def regroup_product_rollup(sender, instance, **kwargs):
+    """The sales of a deleted product stay in the rollup under its name"""
+    product_before_delete(instance)
+
+@receiver(pre_save, sender=Product)
+def remember_product_category(sender, instance, **kwargs):
+    """Note the category a product is being moved out of, if any"""
+    instance._previous_category_id = None
+    if instance.pk:
+        instance._previous_category_id = (
+            Product.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+        )
+
+@receiver(post_save, sender=Product)
+def update_category_count_on_save(sender, instance, created, **kwargs):
+    """Keep Category.product_count right for new products and category changes"""
+    previous = getattr(instance, '_previous_category_id', None)
+    if created:
+        adjust_product_count(instance.category_id, 1)
+    elif previous is not None and previous != instance.category_id:
+        adjust_product_count(previous, -1)
+        adjust_product_count(instance.category_id, 1)
+
+@receiver(post_delete, sender=Product)
+def update_category_count_on_delete(sender, instance, **kwargs):
+    adjust_product_count(instance.category_id, -1)
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    """Keep the search index in step with product edits"""
+    get_search_backend().index_product(instance)
+    index_product_trigrams(instance)
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove_product(instance.pk)
+
+@receiver(post_save, sender=Category)
+def index_category(sender, instance, created, **kwargs):
+    """Renaming a category changes what its products match"""
+    if not created:
+        get_search_backend().index_category(instance)
+        index_category_trigrams(instance)
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+def index_suggestion(sender, instance, **kwargs):
+    """Keep this process's typeahead suggestions in step with names and slugs"""
+    add_suggestion(instance)
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+def unindex_suggestion(sender, instance, **kwargs):
+    remove_suggestion(instance)
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, **kwargs):
+    """
+    Any product or category change invalidates cached listing pages. Connected
+    after the product count handlers so cached pages never see stale counts.
+    """
+    bump_catalog_version()
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_dashboard_charts(sender, **kwargs):
+    """
+    Sales, registrations and product or category names all show in the
+    dashboard charts. Once committed, so a recomputed payload sees the change.
+    """
+    if sender is User and not kwargs.get('created', True):
+        # Logins save the user too, only new users change the registrations
+        return
+    transaction.on_commit(invalidate_chart_data)
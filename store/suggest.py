@@ -0,0 +1,203 @@
+"""
+Typeahead suggestions for the search box.
+
+Product and category names are normalized and stored in one sorted array,
+with a key for every word start ("gaming laptop", "laptop"), so the
+completions of a prefix are a contiguous run found with bisect. Each process
+builds the array on first use, then updates it in place: from the Product and
+Category signals for its own changes, and by re-reading recently updated rows
+when the catalog version shows another process changed the catalog.
+"""
+import bisect
+import datetime
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+from django.urls import reverse
+from django.utils import timezone
+
+from .catalog import catalog_version
+from .models import Category, Product
+
+SUGGEST_LIMIT = 8
+# Keys examined per lookup, bounds the work for very short prefixes
+SUGGEST_SCAN = 200
+SUGGEST_MAX_QUERY_LENGTH = 100
+# Browsers and proxies may reuse a response for this long
+SUGGEST_MAX_AGE = 60
+# At most this many requests per client address per window of seconds
+SUGGEST_RATE_LIMIT = (30, 10)
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def normalize(text):
+    """Lower case, accents stripped, runs of punctuation and spaces made single spaces"""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(re.findall(r'\w+', text.lower()))
+
+
+class SuggestionIndex:
+    """
+    Sorted word-start keys of (kind, label, slug) entries, each entry stored
+    under an id such as ('product', 12) so it can be replaced or removed
+    """
+
+    def __init__(self, entries=()):
+        self.entries = {}
+        self.counts = Counter()
+        keyed = []
+        for entry_id, entry in entries:
+            self.entries[entry_id] = entry
+            self.counts[entry_id[0]] += 1
+            keyed.extend(self.entry_keys(entry_id, entry))
+        keyed.sort()
+        self.keys = [key for key, _, _ in keyed]
+        self.refs = [(mid_name, entry_id) for _, mid_name, entry_id in keyed]
+        self.lock = threading.RLock()
+
+    def entry_keys(self, entry_id, entry):
+        """(key, starts mid-name, entry id) for every word start of an entry's label"""
+        words = normalize(entry[1]).split(' ')
+        return [(' '.join(words[start:]), start > 0, entry_id) for start in range(len(words))]
+
+    def add(self, entry_id, entry):
+        """Add or replace a single entry"""
+        with self.lock:
+            self.remove(entry_id)
+            self.entries[entry_id] = entry
+            self.counts[entry_id[0]] += 1
+            for key, mid_name, _ in self.entry_keys(entry_id, entry):
+                position = bisect.bisect_left(self.keys, key)
+                self.keys.insert(position, key)
+                self.refs.insert(position, (mid_name, entry_id))
+
+    def remove(self, entry_id):
+        with self.lock:
+            entry = self.entries.pop(entry_id, None)
+            if entry is None:
+                return
+            self.counts[entry_id[0]] -= 1
+            for key, _, _ in self.entry_keys(entry_id, entry):
+                position = bisect.bisect_left(self.keys, key)
+                while self.refs[position][1] != entry_id:
+                    position += 1
+                del self.keys[position]
+                del self.refs[position]
+
+    def lookup(self, prefix, limit=SUGGEST_LIMIT):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        best = {}
+        with self.lock:
+            start = bisect.bisect_left(self.keys, prefix)
+            for key, (mid_name, entry_id) in zip(
+                self.keys[start:start + SUGGEST_SCAN], self.refs[start:start + SUGGEST_SCAN]
+            ):
+                if not key.startswith(prefix):
+                    break
+                if entry_id not in best or not mid_name:
+                    best[entry_id] = mid_name
+            entries = {entry_id: self.entries[entry_id] for entry_id in best}
+
+        def order(entry_id):
+            kind, label, _ = entries[entry_id]
+            # Whole-name matches first, categories before products, then shorter names
+            return (best[entry_id], kind != 'category', len(label), label)
+
+        return [entries[entry_id] for entry_id in sorted(best, key=order)[:limit]]
+
+
+def suggestion_entry(instance):
+    """(entry id, entry) of a Product or Category"""
+    kind = 'category' if isinstance(instance, Category) else 'product'
+    return (kind, instance.pk), (kind, instance.name, instance.slug)
+
+
+def category_entries(categories):
+    for pk, name, slug in categories.values_list('pk', 'name', 'slug'):
+        yield ('category', pk), ('category', name, slug)
+
+
+def product_entries(products):
+    for pk, name, slug in products.values_list('pk', 'name', 'slug').iterator(chunk_size=2000):
+        yield ('product', pk), ('product', name, slug)
+
+
+def build_suggestion_index():
+    version, started = catalog_version(), timezone.now()
+    entries = list(category_entries(Category.objects.all()))
+    entries += product_entries(Product.objects.all())
+    index = SuggestionIndex(entries)
+    index.synced_version = version
+    index.synced_at = started
+    return index
+
+
+def sync_suggestion_index(index):
+    """
+    Catch up with products and categories changed by other processes since
+    the index was last synced, which the catalog version tells us happened
+    """
+    version = catalog_version()
+    if version == index.synced_version:
+        return
+    started = timezone.now()
+    # Allow for writes that committed while the previous sync was running
+    since = index.synced_at - datetime.timedelta(seconds=5)
+
+    changed = list(category_entries(Category.objects.filter(updated_at__gte=since)))
+    changed += product_entries(Product.objects.filter(updated_at__gte=since))
+    for entry_id, entry in changed:
+        index.add(entry_id, entry)
+
+    for kind, model in (('category', Category), ('product', Product)):
+        if model.objects.count() != index.counts[kind]:
+            existing = set(model.objects.values_list('pk', flat=True))
+            for entry_kind, pk in list(index.entries):
+                if entry_kind == kind and pk not in existing:
+                    index.remove((kind, pk))
+
+    index.synced_version = version
+    index.synced_at = started
+
+
+def get_suggestion_index():
+    """This process's suggestion index, built on first use"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = build_suggestion_index()
+        else:
+            sync_suggestion_index(_index)
+        return _index
+
+
+def add_suggestion(instance):
+    """Add or update the entry of a saved Product or Category"""
+    # An index not built yet will read it when it is
+    if _index is not None:
+        _index.add(*suggestion_entry(instance))
+
+
+def remove_suggestion(instance):
+    if _index is not None:
+        _index.remove(suggestion_entry(instance)[0])
+
+
+def get_suggestions(query, limit=SUGGEST_LIMIT):
+    """JSON-ready completions of query"""
+    suggestions = []
+    for kind, label, slug in get_suggestion_index().lookup(query[:SUGGEST_MAX_QUERY_LENGTH], limit):
+        if kind == 'category':
+            url = reverse('category_detail', kwargs={'category_slug': slug})
+        else:
+            url = reverse('product_detail', kwargs={'product_slug': slug})
+        suggestions.append({'type': kind, 'label': label, 'url': url})
+    return suggestions
@@ -0,0 +1,471 @@
+import datetime
+from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .carts import CART_COOKIE_NAME, CART_COUNT_SESSION_KEY, cart_cache_key
+from .models import Cart, CartItem, Category, DailySalesRollup, Order, OrderItem, Product
+from .pagination import KeysetPaginator
+from .rollups import refresh_days
+from .searchlog import flush_search_log
+
+
+def create_products(category, count, **fields):
+    return [
+        Product.objects.create(
+            category=category, name=f'Product {i}', description='A product', price=10, **fields
+        )
+        for i in range(count)
+    ]
+
+
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Gadgets')
+
+    def set_created_at(self, products, step):
+        """Give products created_at values step apart, newest first, off whole milliseconds"""
+        start = timezone.now().replace(microsecond=123456)
+        for i, product in enumerate(products):
+            Product.objects.filter(pk=product.pk).update(created_at=start - i * step)
+
+    def walk(self, per_page):
+        """Every page forwards from the first, then backwards from the last"""
+        paginator = KeysetPaginator(Product.objects.all(), per_page=per_page)
+        forward = [paginator.page()]
+        while forward[-1].has_next():
+            forward.append(paginator.page(forward[-1].next_cursor))
+        backward = [forward[-1]]
+        while backward[-1].has_previous():
+            backward.append(paginator.page(backward[-1].previous_cursor))
+        return [list(page) for page in forward], [list(page) for page in reversed(backward)]
+
+    def assertWalksAll(self, per_page):
+        expected = list(Product.objects.order_by('-created_at', '-id'))
+        forward, backward = self.walk(per_page)
+        self.assertEqual(forward, [expected[i:i + per_page] for i in range(0, len(expected), per_page)])
+        self.assertEqual(backward, forward)
+
+    def test_rows_a_second_apart(self):
+        self.set_created_at(create_products(self.category, 7), datetime.timedelta(seconds=1))
+        self.assertWalksAll(per_page=2)
+
+    def test_rows_within_one_millisecond(self):
+        self.set_created_at(create_products(self.category, 6), datetime.timedelta(microseconds=1))
+        self.assertWalksAll(per_page=2)
+
+    def test_rows_with_equal_created_at(self):
+        self.set_created_at(create_products(self.category, 5), datetime.timedelta(0))
+        self.assertWalksAll(per_page=2)
+
+    def test_invalid_cursor_gives_first_page(self):
+        create_products(self.category, 3)
+        paginator = KeysetPaginator(Product.objects.all(), per_page=2)
+        self.assertEqual(list(paginator.page('not-a-cursor')), list(paginator.page()))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Checks SQLite query plans')
+class ListingIndexTests(TestCase):
+    """Every listing reads its first, next and previous pages through its own index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Gadgets')
+        create_products(
+            cls.category, 5, is_featured=True, is_new_arrival=True,
+            is_best_seller=True, is_on_sale=True, discount_percentage=10,
+        )
+
+    def assertUsesIndex(self, index, queryset, ordering=('-created_at', '-id')):
+        paginator = KeysetPaginator(queryset, ordering, per_page=2)
+        product = Product.objects.order_by('-created_at', '-id')[2]
+        values = [getattr(product, name) for name, _ in paginator.fields]
+        pages = {
+            'first': paginator.page_queryset(),
+            'next': paginator.page_queryset(values),
+            'previous': paginator.page_queryset(values, reverse=True),
+        }
+        for page, page_queryset in pages.items():
+            with self.subTest(page=page):
+                self.assertIn(index, page_queryset.explain())
+
+    def test_all_products(self):
+        self.assertUsesIndex('product_created_idx', Product.objects.for_cards())
+
+    def test_category(self):
+        self.assertUsesIndex('product_category_created_idx', Product.objects.for_cards().filter(category=self.category))
+
+    def test_featured(self):
+        self.assertUsesIndex('product_featured_idx', Product.objects.for_cards().filter(is_featured=True))
+
+    def test_new_arrivals(self):
+        self.assertUsesIndex('product_new_arrival_idx', Product.objects.for_cards().filter(is_new_arrival=True))
+
+    def test_best_sellers(self):
+        self.assertUsesIndex('product_best_seller_idx', Product.objects.for_cards().filter(is_best_seller=True))
+
+    def test_on_sale(self):
+        self.assertUsesIndex(
+            'product_on_sale_idx',
+            Product.objects.for_cards().filter(is_on_sale=True),
+            ordering=('-discount_percentage', '-created_at', '-id'),
+        )
+
+
+class ListingQueryCountTests(TestCase):
+    """Listing pages run the same number of queries whatever the catalog size"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Gadgets')
+
+    def assertConstantQueries(self, num, url, sizes=(10, 40)):
+        for size in sizes:
+            create_products(
+                self.category, size - Product.objects.count(), is_featured=True, is_new_arrival=True,
+                is_best_seller=True, is_on_sale=True, discount_percentage=10,
+            )
+            cache.clear()
+            with self.subTest(products=size), self.assertNumQueries(num):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_product_list(self):
+        self.assertConstantQueries(2, reverse('product_list'))
+
+    def test_home(self):
+        self.assertConstantQueries(2, reverse('home'))
+
+    def test_search_results(self):
+        self.assertConstantQueries(4, reverse('search_results') + '?q=product')
+        flush_search_log()
+
+    def test_category_products(self):
+        self.assertConstantQueries(2, reverse('category_products', args=[self.category.slug]))
+
+    def test_flag_listings(self):
+        for name in ('new_arrivals', 'featured', 'best_sellers', 'on_sale_products'):
+            with self.subTest(listing=name):
+                Product.objects.all().delete()
+                self.assertConstantQueries(1, reverse(name))
+
+
+class SalesRollupTests(TestCase):
+    """The rollup kept up by the order signals matches a rebuild from the orders"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Gadgets')
+        cls.lamp, cls.chair = create_products(cls.category, 2)
+
+    def create_order(self, *lines, status='pending'):
+        order = Order.objects.create(
+            full_name='Ada', email='ada@example.com', phone='1', address='1 Road', city='Town',
+            state='State', zip_code='1', country='Country', status=status,
+            total=sum(Decimal(10) * quantity for _, quantity in lines),
+        )
+        for product, quantity in lines:
+            OrderItem.objects.create(
+                order=order, product=product, category=product.category, product_name=product.name,
+                product_price=10, quantity=quantity, subtotal=Decimal(10) * quantity,
+            )
+        return order
+
+    def rollup_rows(self):
+        return sorted(
+            DailySalesRollup.objects.values_list(
+                'date', 'status', 'product_id', 'product_name', 'category_id', 'revenue', 'units', 'order_count',
+            ),
+            key=repr,
+        )
+
+    def assertMatchesRebuild(self):
+        rows = self.rollup_rows()
+        today = timezone.localdate()
+        refresh_days(today - datetime.timedelta(days=7), today + datetime.timedelta(days=1))
+        self.assertEqual(rows, self.rollup_rows())
+
+    def test_create(self):
+        self.create_order((self.lamp, 1), (self.chair, 2))
+        self.create_order((self.lamp, 3))
+        self.assertMatchesRebuild()
+
+    def test_status_change(self):
+        order = self.create_order((self.lamp, 1), (self.chair, 2))
+        self.create_order((self.lamp, 1))
+        order.status = 'shipped'
+        order.save()
+        self.assertMatchesRebuild()
+
+    def test_date_change(self):
+        order = self.create_order((self.lamp, 1), (self.chair, 2))
+        self.create_order((self.lamp, 1))
+        order.created_at -= datetime.timedelta(days=2)
+        order.save()
+        self.assertMatchesRebuild()
+
+    def test_item_edit(self):
+        order = self.create_order((self.lamp, 1), (self.chair, 2))
+        item = order.items.get(product=self.lamp)
+        item.quantity, item.subtotal = 4, 40
+        item.save()
+        item = order.items.get(product=self.chair)
+        item.product, item.product_name = self.lamp, self.lamp.name
+        item.save()
+        self.assertMatchesRebuild()
+
+    def test_item_delete(self):
+        order = self.create_order((self.lamp, 1), (self.chair, 2), (self.lamp, 1))
+        order.items.filter(product=self.chair).delete()
+        order.items.filter(product=self.lamp).first().delete()
+        self.assertMatchesRebuild()
+
+    def test_order_delete_with_repeated_product_lines(self):
+        self.create_order((self.lamp, 1))
+        order = self.create_order((self.lamp, 1), (self.lamp, 1), (self.chair, 1))
+        order.delete()
+        self.assertEqual(
+            list(DailySalesRollup.objects.product_totals().values_list('product_id', 'revenue', 'units', 'order_count')),
+            [(self.lamp.pk, Decimal(10), 1, 1)],
+        )
+        self.assertMatchesRebuild()
+
+    def test_product_delete(self):
+        self.create_order((self.lamp, 1), (self.chair, 2))
+        self.create_order((self.lamp, 2))
+        self.lamp.delete()
+        self.assertMatchesRebuild()
+
+    def test_category_delete(self):
+        self.create_order((self.lamp, 1), (self.chair, 2))
+        self.category.delete()
+        self.assertMatchesRebuild()
+
+
+class DashboardDataTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        cls.lamp = create_products(Category.objects.create(name='Gadgets'), 1)[0]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.staff)
+
+    def test_unchanged_data_is_not_modified_without_queries(self):
+        response = self.client.get(reverse('dashboard_data'))
+        self.assertEqual(response.status_code, 200)
+        # The session and the staff user only
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('dashboard_data'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_rename_changes_the_etag(self):
+        etag = self.client.get(reverse('dashboard_data'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lamp.name = 'Desk lamp'
+            self.lamp.save()
+        response = self.client.get(reverse('dashboard_data'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class CartTests(TestCase):
+    """Adding, changing and removing items, and carrying the cart over at login"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.lamp, cls.chair = create_products(Category.objects.create(name='Gadgets'), 2)
+        cls.chair.is_on_sale, cls.chair.sale_price = True, Decimal('7.50')
+        cls.chair.save()
+        cls.user = User.objects.create_user('ada', password='secret')
+
+    def setUp(self):
+        cache.clear()
+
+    def add(self, product, quantity):
+        return self.client.post(
+            reverse('add_to_cart', args=[product.slug]), {'quantity': quantity},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        ).json()
+
+    def update(self, item_id, quantity):
+        return self.client.post(
+            reverse('update_cart', args=[item_id]), {'quantity': quantity},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        ).json()
+
+    def remove(self, item_id):
+        return self.client.post(
+            reverse('remove_from_cart', args=[item_id]), HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        ).json()
+
+    def cart_page(self):
+        """The badge count and the total the cart page shows"""
+        response = self.client.get(reverse('cart'))
+        self.assertEqual(response.status_code, 200)
+        return response.context['cart_count'], response.context['cart_total']
+
+    def item_id(self, product):
+        return CartItem.objects.get(product=product).pk
+
+    def assertSessionCount(self, count):
+        self.assertEqual(self.client.session[CART_COUNT_SESSION_KEY], count)
+
+    def user_cart(self):
+        return dict(Cart.objects.get(user=self.user).items.values_list('product_id', 'quantity'))
+
+    def log_in(self):
+        response = self.client.post(reverse('login'), {'username': 'ada', 'password': 'secret'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_add_update_remove(self):
+        self.assertEqual(self.add(self.lamp, 2)['cart_count'], 2)
+        self.assertEqual(self.add(self.chair, 1)['cart_count'], 3)
+        self.assertEqual(self.add(self.lamp, 1)['cart_count'], 4)
+        self.assertSessionCount(4)
+        self.assertEqual(self.cart_page(), (4, Decimal('37.50')))
+
+        lamp = self.item_id(self.lamp)
+        self.assertEqual(
+            self.update(lamp, 5),
+            {'success': True, 'cart_count': 6, 'cart_total': 57.5, 'item_subtotal': 50.0},
+        )
+        self.assertEqual(self.remove(self.item_id(self.chair)), {'success': True, 'cart_count': 5, 'cart_total': 50.0})
+        self.assertSessionCount(5)
+        self.assertEqual(self.update(lamp, 0)['cart_count'], 0)
+        self.assertEqual(self.cart_page(), (0, Decimal('0.00')))
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_badge_count_is_read_from_the_session(self):
+        self.add(self.lamp, 2)
+        # Changed behind the session's back, e.g. from another device
+        CartItem.objects.update(quantity=9)
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['cart_count'], 2)
+        # The cart page counts again and stores the new count
+        self.assertEqual(self.cart_page(), (9, Decimal('90.00')))
+        self.assertEqual(self.client.session[CART_COUNT_SESSION_KEY], 9)
+
+    def test_browsing_starts_no_session(self):
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['cart_count'], 0)
+        self.assertNotIn('sessionid', response.cookies)
+
+    def test_login_merges_overlapping_items(self):
+        Cart.objects.create(user=self.user).add_quantities({self.lamp.pk: 1})
+        self.add(self.lamp, 2)
+        self.add(self.chair, 1)
+        self.log_in()
+        self.assertEqual(self.user_cart(), {self.lamp.pk: 3, self.chair.pk: 1})
+        self.assertEqual(Cart.objects.count(), 1)
+        self.assertEqual(self.cart_page(), (4, Decimal('37.50')))
+
+    def test_login_merges_other_items(self):
+        Cart.objects.create(user=self.user).add_quantities({self.chair.pk: 2})
+        self.add(self.lamp, 1)
+        self.log_in()
+        self.assertEqual(self.user_cart(), {self.lamp.pk: 1, self.chair.pk: 2})
+        self.assertEqual(Cart.objects.count(), 1)
+        self.assertEqual(self.cart_page(), (3, Decimal('25.00')))
+
+    def test_login_takes_over_the_anonymous_cart(self):
+        self.add(self.lamp, 2)
+        anonymous = Cart.objects.get()
+        self.log_in()
+        self.assertEqual(Cart.objects.get(user=self.user), anonymous)
+        self.assertEqual(self.cart_page(), (2, Decimal('20.00')))
+
+
+@override_settings(STORE_CART_BACKEND='cache')
+class CacheCartTests(CartTests):
+    """The same, with anonymous carts held in the cache"""
+
+    def item_id(self, product):
+        # A cached cart has one line per product, named by the product id
+        return product.pk
+
+    def assertSessionCount(self, count):
+        # Cached carts are counted from the cache, the session is never started
+        self.assertNotIn('sessionid', self.client.cookies)
+
+    def test_add_update_remove(self):
+        super().test_add_update_remove()
+        self.assertFalse(Cart.objects.exists())
+
+    def test_anonymous_cart_writes_nothing_to_the_database(self):
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                reverse('add_to_cart', args=[self.lamp.slug]), {'quantity': 2},
+                HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            )
+        token = response.cookies[CART_COOKIE_NAME].value
+        self.assertEqual(cache.get(cart_cache_key(token)), {self.lamp.pk: 2})
+        self.assertNotIn('sessionid', response.cookies)
+        self.assertEqual(self.cart_page(), (2, Decimal('20.00')))
+
+    def test_badge_count_is_read_from_the_session(self):
+        # Cached carts are counted from the cache, there is no session to read
+        self.add(self.lamp, 2)
+        token = self.client.cookies[CART_COOKIE_NAME].value
+        cache.set(cart_cache_key(token), {self.lamp.pk: 9})
+        self.assertEqual(self.client.get(reverse('home')).context['cart_count'], 9)
+
+    def test_login_merges_overlapping_items(self):
+        super().test_login_merges_overlapping_items()
+        token = self.client.cookies[CART_COOKIE_NAME].value
+        self.assertIsNone(cache.get(cart_cache_key(token)))
+
+    def test_login_takes_over_the_anonymous_cart(self):
+        self.add(self.lamp, 2)
+        self.log_in()
+        self.assertEqual(self.user_cart(), {self.lamp.pk: 2})
+        self.assertEqual(self.cart_page(), (2, Decimal('20.00')))
+
+
+class PurgeAbandonedCartsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lamp = create_products(Category.objects.create(name='Gadgets'), 1)[0]
+        cls.user = User.objects.create_user('ada', password='secret')
+
+    def create_cart(self, days_old, **fields):
+        cart = Cart.objects.create(**fields)
+        cart.add_quantities({self.lamp.pk: 1})
+        Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now() - datetime.timedelta(days=days_old))
+        return cart
+
+    def purge(self, **options):
+        out = StringIO()
+        call_command('purge_abandoned_carts', sleep=0, stdout=out, **options)
+        return out.getvalue()
+
+    def test_deletes_old_anonymous_carts_in_batches(self):
+        for number in range(5):
+            self.create_cart(40, session_id=f'old-{number}')
+        recent = self.create_cart(5, session_id='recent')
+        user_cart = self.create_cart(40, user=self.user)
+
+        output = self.purge(batch_size=2)
+        self.assertIn('5 carts and 5 cart items in 3 batches', output)
+        self.assertQuerySetEqual(Cart.objects.order_by('pk'), [recent, user_cart])
+        self.assertEqual(CartItem.objects.count(), 2)
+
+    def test_include_user_carts(self):
+        self.create_cart(40, user=self.user)
+        self.create_cart(40, session_id='old')
+        self.assertIn('2 carts and 2 cart items in 1 batches', self.purge(include_user_carts=True))
+        self.assertFalse(Cart.objects.exists())
+
+    def test_dry_run_deletes_nothing(self):
+        self.create_cart(40, session_id='old')
+        self.assertIn('1 carts untouched', self.purge(dry_run=True))
+        self.assertEqual(Cart.objects.count(), 1)
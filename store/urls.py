@@ -18,6 +18,7 @@ urlpatterns = [
     # Home/Dashboard
     path('', views.dashboard, name='index'),  # Landing page is now the dashboard
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('dashboard/data.json', views.dashboard_data, name='dashboard_data'),
     path('dashboard/clear-report/', views.clear_report, name='clear_report'),
     path('home/', views.home, name='home'),
     
@@ -118,6 +119,7 @@ urlpatterns = [
     
     # Search
     path('search/', views.search_results, name='search_results'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
     
     # Static Pages
     path('about/', views.about, name='about'),
@@ -134,6 +136,8 @@ urlpatterns = [
     
     # Reports (Admin)
     path('report/', views.report_page, name='report_page'),
+    path('report/export-orders/', views.export_orders, name='export_orders'),
+    path('report/searches/', views.search_report, name='search_report'),
     path('clear_report/', views.clear_report, name='clear_report'),
     path('reset_order_sequence/', views.reset_order_sequence, name='reset_order_sequence'),
     
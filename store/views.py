@@ -5,19 +5,37 @@ from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django.contrib.auth.views import LoginView
-from django.db.models import Sum, Count, Q
-from django.db import IntegrityError
-from .models import Category, Product, Cart, CartItem, Order, OrderItem, UserProfile, Wishlist, Address
-from django.http import JsonResponse, HttpResponseRedirect
+from django.db import IntegrityError, transaction
+from .models import Category, Product, Order, OrderItem, UserProfile, Wishlist, Address
+from django.http import Http404, JsonResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.urls import reverse
+from django.core.paginator import Paginator
 from django.views.decorators.http import require_POST
 from django.utils import timezone
 from django.utils.text import slugify
+from django.utils.dateparse import parse_date
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
 from .payments import create_payment_intent as create_stripe_payment_intent
+from .analytics import (
+    ChartRange, GRANULARITIES, SEARCH_REPORT_DAYS, build_report, build_search_report, chart_data_version,
+    get_chart_data, invalidate_chart_data,
+)
+from .rollups import day_bounds
+from .exports import EXPORT_FORMATS, export_orders as export_orders_queryset, export_rows, parse_export_filters
+from .pagination import paginate_products
+from .shelves import get_home_page
+from .facets import search_facets
+from .search_cache import SEARCH_RESULTS_PER_PAGE, get_search_page, parse_search_params
+from .searchlog import flush_search_log, log_search
+from .carts import CART_COUNT_SESSION_KEY, get_cart, get_or_create_cart, remember_cart_count, set_cart_cookie
+from .suggest import SUGGEST_MAX_AGE, SUGGEST_RATE_LIMIT, get_suggestions
+from .ratelimit import is_rate_limited
 import json
 import random
+import time
 from decimal import Decimal
 from .forms import CustomUserCreationForm, ProductForm, CategoryForm, UserProfileForm
 
@@ -31,7 +49,7 @@ class CustomLoginView(LoginView):
 def dashboard(request):
     # Get some stats for the dashboard
     total_products = Product.objects.count()
-    categories = Category.objects.annotate(product_count=Count('products'))
+    categories = Category.objects.all()
     recent_products = Product.objects.order_by('-created_at')[:5]
     
     context = {
@@ -46,215 +64,53 @@ def dashboard(request):
         recent_orders = Order.objects.order_by('-created_at')[:5]
         total_users = User.objects.count()
         
-        # Get real data for charts if available
-        # Sales by month (for the sales trend chart)
-        sales_by_month = {}
-        
-        # All orders from the last 12 months
-        twelve_months_ago = timezone.now() - timezone.timedelta(days=365)
-        orders = Order.objects.filter(created_at__gte=twelve_months_ago)
-        
-        # Group by month and calculate total sales
-        for order in orders:
-            month = order.created_at.strftime('%b')  # Abbreviated month name
-            if month in sales_by_month:
-                sales_by_month[month] += float(order.total)
-            else:
-                sales_by_month[month] = float(order.total)
-        
-        # Order by month using month numbers
-        months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-        ordered_sales = [sales_by_month.get(month, 0) for month in months]
-        
-        # Get category distribution data
-        category_data = []
-        category_labels = []
-        for category in categories:
-            category_labels.append(category.name)
-            # Count total sales in this category
-            category_sales = sum(
-                float(order_item.subtotal)
-                for order in orders
-                for order_item in order.items.all()
-                if order_item.product_name in [p.name for p in category.products.all()]
-            )
-            category_data.append(category_sales if category_sales > 0 else 0)
-        
-        # Order status data
-        status_counts = {}
-        for status, _ in Order.STATUS_CHOICES:
-            status_counts[status] = Order.objects.filter(status=status).count()
-        
-        status_labels = [status.capitalize() for status, _ in Order.STATUS_CHOICES]
-        status_data = [status_counts.get(status.lower(), 0) for status, _ in Order.STATUS_CHOICES]
-        
-        # Top products data
-        top_products = []
-        product_sales = {}
-        
-        # Calculate sales for each product
-        for order in orders:
-            for item in order.items.all():
-                if item.product_name in product_sales:
-                    product_sales[item.product_name] += float(item.subtotal)
-                else:
-                    product_sales[item.product_name] = float(item.subtotal)
-        
-        # Sort by sales amount and get top 5
-        sorted_products = sorted(product_sales.items(), key=lambda x: x[1], reverse=True)[:5]
-        top_product_labels = [p[0] for p in sorted_products]
-        top_product_data = [p[1] for p in sorted_products]
-        
-        # New users registration trend
-        user_registration = {}
-        
-        # All users from the last 6 months
-        six_months_ago = timezone.now() - timezone.timedelta(days=180)
-        users = User.objects.filter(date_joined__gte=six_months_ago)
-        
-        # Group by month and count
-        for user in users:
-            month = user.date_joined.strftime('%b')  # Abbreviated month name
-            if month in user_registration:
-                user_registration[month] += 1
-            else:
-                user_registration[month] = 1
-        
-        # Get last 6 months in order
-        current_month = timezone.now().month
-        last_6_months = []
-        for i in range(6):
-            month_number = ((current_month - i - 1) % 12) + 1
-            last_6_months.insert(0, months[month_number - 1])
-        
-        user_reg_data = [user_registration.get(month, 0) for month in last_6_months]
-        
-        # Sales comparison data (current month vs previous month)
-        current_month_start = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        prev_month_start = (current_month_start - timezone.timedelta(days=1)).replace(day=1)
-        
-        current_month_orders = Order.objects.filter(created_at__gte=current_month_start)
-        prev_month_orders = Order.objects.filter(created_at__gte=prev_month_start, created_at__lt=current_month_start)
-        
-        # Group into weeks
-        current_month_weeks = [0.0, 0.0, 0.0, 0.0]
-        prev_month_weeks = [0.0, 0.0, 0.0, 0.0]
-        
-        for order in current_month_orders:
-            # Determine which week of the month (0-3)
-            week = min(3, (order.created_at.day - 1) // 7)
-            current_month_weeks[week] += float(order.total)
-        
-        for order in prev_month_orders:
-            # Determine which week of the month (0-3)
-            week = min(3, (order.created_at.day - 1) // 7)
-            prev_month_weeks[week] += float(order.total)
-        
-        # Prepare chart data in JSON format for the template
-        chart_data = {
-            'salesTrendData': {
-                'labels': months,
-                'datasets': [{
-                    'label': 'Sales',
-                    'data': ordered_sales,
-                    'borderColor': '#6c63ff',
-                    'backgroundColor': 'rgba(108, 99, 255, 0.2)',
-                    'borderWidth': 3,
-                    'pointRadius': 4,
-                    'fill': True,
-                    'tension': 0.4
-                }]
-            },
-            'categoryData': {
-                'labels': category_labels,
-                'datasets': [{
-                    'data': category_data,
-                    'backgroundColor': [
-                        '#6c63ff', '#ff6b6b', '#36e2a8', '#ffcf5c', '#4dc9ff',
-                        '#b266ff', '#05dfd7', '#fb8c34', '#ff66c4'
-                    ],
-                    'borderColor': '#1a1b3c',
-                    'borderWidth': 2,
-                    'hoverOffset': 15
-                }]
-            },
-            'orderStatusData': {
-                'labels': status_labels,
-                'datasets': [{
-                    'data': status_data,
-                    'backgroundColor': [
-                        '#ffcf5c', '#6c63ff', '#4dc9ff', '#36e2a8', '#ff6b6b'
-                    ],
-                    'borderWidth': 0,
-                    'borderRadius': 4,
-                    'barThickness': 16
-                }]
-            },
-            'topProductsData': {
-                'labels': top_product_labels,
-                'datasets': [{
-                    'axis': 'y',
-                    'label': 'Sales',
-                    'data': top_product_data,
-                    'backgroundColor': [
-                        '#6c63ff', '#36e2a8', '#4dc9ff', '#b266ff', '#ffcf5c'
-                    ],
-                    'borderWidth': 1,
-                    'borderRadius': 4
-                }]
-            },
-            'userRegistrationData': {
-                'labels': last_6_months,
-                'datasets': [{
-                    'label': 'New Users',
-                    'data': user_reg_data,
-                    'backgroundColor': 'rgba(77, 201, 255, 0.2)',
-                    'borderColor': '#4dc9ff',
-                    'borderWidth': 2,
-                    'fill': True,
-                    'tension': 0.4
-                }]
-            },
-            'comparisonData': {
-                'labels': ['Week 1', 'Week 2', 'Week 3', 'Week 4'],
-                'datasets': [
-                    {
-                        'label': 'Current Month',
-                        'data': current_month_weeks,
-                        'backgroundColor': 'rgba(108, 99, 255, 0.2)',
-                        'borderColor': '#6c63ff',
-                        'borderWidth': 2,
-                        'pointRadius': 4
-                    },
-                    {
-                        'label': 'Previous Month',
-                        'data': prev_month_weeks,
-                        'backgroundColor': 'rgba(255, 107, 107, 0.2)',
-                        'borderColor': '#ff6b6b',
-                        'borderWidth': 2,
-                        'pointRadius': 4
-                    }
-                ]
-            }
-        }
-        
+        # Chart data is fetched by dashboard_charts.js from dashboard_data,
+        # the range filter is passed through to it unchanged
         context.update({
             'total_orders': total_orders,
             'recent_orders': recent_orders,
             'total_users': total_users,
-            'chart_data': chart_data
+            'chart_query': request.GET.urlencode(),
+            'granularities': GRANULARITIES,
         })
     
     return render(request, 'store/dashboard.html', context)
 
+@staff_member_required
+def dashboard_data(request):
+    """Chart data for the dashboard as JSON, answering conditional GETs with 304"""
+    try:
+        chart_range = ChartRange.from_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    last_modified, etag = chart_data_version()
+    response = get_conditional_response(
+        request,
+        etag=quote_etag(etag),
+        last_modified=int(last_modified.timestamp()),
+    )
+    if response is None:
+        # The cached payload may lag behind the current version for a moment,
+        # so describe the payload actually served
+        chart_data, (last_modified, etag) = get_chart_data((last_modified, etag), chart_range)
+        response = JsonResponse(chart_data)
+    
+    response['ETag'] = quote_etag(etag)
+    response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Let the browser keep the payload but revalidate it on every visit
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
 # Product views
 def product_list(request):
-    products = Product.objects.all()
+    products = paginate_products(request, Product.objects.for_cards(), 'all')
     featured_products = Product.objects.filter(is_featured=True)
     categories = Category.objects.all()
     
     context = {
         'products': products,
+        'page_obj': products,
         'featured_products': featured_products,
         'categories': categories,
     }
@@ -407,11 +263,12 @@ def category_list(request):
 
 def category_detail(request, category_slug):
     category = get_object_or_404(Category, slug=category_slug)
-    products = Product.objects.filter(category=category)
+    products = paginate_products(request, Product.objects.for_cards().filter(category=category), f'category:{category.id}')
     
     context = {
         'category': category,
         'products': products,
+        'page_obj': products,
     }
     
     return render(request, 'store/category_detail.html', context)
@@ -464,18 +321,13 @@ def delete_category(request, category_slug):
     return render(request, 'store/delete_category.html', {'category': category})
 
 # Cart views
-def get_or_create_cart(request):
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-    else:
-        session_id = request.session.session_key
-        if not session_id:
-            request.session.create()
-            session_id = request.session.session_key
-        
-        cart, created = Cart.objects.get_or_create(session_id=session_id)
-    
-    return cart
+def get_visitor_cart_item(request, cart_item_id):
+    """The visitor's cart and one of its items, 404 if the item is not in it"""
+    cart = get_cart(request)
+    cart_item = cart.get_item(cart_item_id) if cart is not None else None
+    if cart_item is None:
+        raise Http404('No such item in your cart')
+    return cart, cart_item
 
 @require_POST
 def add_to_cart(request, product_slug):
@@ -496,55 +348,59 @@ def add_to_cart(request, product_slug):
         # Handle regular form submission
         quantity = int(request.POST.get('quantity', 1))
     
-    # Check if the product is already in the cart
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart,
-        product=product,
-        defaults={'quantity': quantity}
-    )
-    
-    # If it already exists, update the quantity instead
-    if not created:
-        cart_item.quantity += quantity
-        cart_item.save()
+    # Adds to the quantity if the product is already in the cart
+    cart.add_product(product, quantity)
+    cart_count = remember_cart_count(request, cart)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return JsonResponse({
+        response = JsonResponse({
             'success': True,
-            'cart_count': cart.item_count(),
+            'cart_count': cart_count,
         })
+    else:
+        response = redirect('cart')
     
-    return redirect('cart')
+    return set_cart_cookie(response, cart)
 
 def cart_view(request):
-    cart = get_or_create_cart(request)
-    cart_items = cart.items.all()
+    # An empty cart page needs no cart, so none is created just to show it
+    cart = get_cart(request)
+    if cart is not None:
+        cart_items = cart.line_items()
+        summary = cart.summary()
+        # Resync the header badge, e.g. after the cart changed in another session
+        remember_cart_count(request, cart, summary['item_count'])
+    else:
+        cart_items = []
+        summary = {'total': Decimal('0.00'), 'item_count': 0}
     
     context = {
         'cart': cart,
         'cart_items': cart_items,
+        'cart_subtotal': summary['total'],
+        'cart_total': summary['total'],
     }
     
     return render(request, 'store/cart.html', context)
 
 @require_POST
 def update_cart(request, cart_item_id):
-    cart_item = get_object_or_404(CartItem, id=cart_item_id)
+    cart, cart_item = get_visitor_cart_item(request, cart_item_id)
     quantity = int(request.POST.get('quantity', 1))
     
     if quantity > 0:
-        cart_item.quantity = quantity
-        cart_item.save()
+        cart.set_quantity(cart_item, quantity)
     else:
-        cart_item.delete()
+        cart.remove_item(cart_item)
     
-    cart = cart_item.cart
+    summary = cart.summary()
+    remember_cart_count(request, cart, summary['item_count'])
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({
             'success': True,
-            'cart_count': cart.item_count(),
-            'cart_total': float(cart.total()),
+            'cart_count': summary['item_count'],
+            'cart_total': float(summary['total']),
             'item_subtotal': float(cart_item.subtotal()) if quantity > 0 else 0,
         })
     
@@ -552,15 +408,16 @@ def update_cart(request, cart_item_id):
 
 @require_POST
 def remove_from_cart(request, cart_item_id):
-    cart_item = get_object_or_404(CartItem, id=cart_item_id)
-    cart = cart_item.cart
-    cart_item.delete()
+    cart, cart_item = get_visitor_cart_item(request, cart_item_id)
+    cart.remove_item(cart_item)
+    summary = cart.summary()
+    remember_cart_count(request, cart, summary['item_count'])
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({
             'success': True,
-            'cart_count': cart.item_count(),
-            'cart_total': float(cart.total()),
+            'cart_count': summary['item_count'],
+            'cart_total': float(summary['total']),
         })
     
     return redirect('cart')
@@ -644,34 +501,40 @@ def checkout(request):
             # In a real app, you would process Apple Pay here
             payment_status = 'processed'
         
-        # Create order
-        order = Order(
-            user=request.user if request.user.is_authenticated else None,
-            full_name=full_name,
-            email=email,
-            phone=phone,
-            address=address,
-            city=city,
-            state=state,
-            zip_code=zip_code,
-            country=country,
-            total=cart.total(),
-            status='pending'
-        )
-        order.save()
-        
-        # Create order items
-        for cart_item in cart.items.all():
-            OrderItem.objects.create(
-                order=order,
-                product_name=cart_item.product.name,
-                product_price=cart_item.product.price,
-                quantity=cart_item.quantity,
-                subtotal=cart_item.subtotal()
+        # Create the order, its items and clear the cart in one transaction,
+        # along with the daily sales rollup updates they make
+        with transaction.atomic():
+            order = Order(
+                user=request.user if request.user.is_authenticated else None,
+                full_name=full_name,
+                email=email,
+                phone=phone,
+                address=address,
+                city=city,
+                state=state,
+                zip_code=zip_code,
+                country=country,
+                total=cart.total(),
+                status='pending'
             )
+            order.save()
+            
+            # Create order items
+            for cart_item in cart.items.select_related('product'):
+                OrderItem.objects.create(
+                    order=order,
+                    product=cart_item.product,
+                    category_id=cart_item.product.category_id,
+                    product_name=cart_item.product.name,
+                    product_price=cart_item.product.get_display_price(),
+                    quantity=cart_item.quantity,
+                    subtotal=cart_item.subtotal()
+                )
+            
+            # Clear the cart
+            cart.items.all().delete()
         
-        # Clear the cart
-        cart.items.all().delete()
+        request.session[CART_COUNT_SESSION_KEY] = 0
         
         # Show success message
         messages.success(request, 'Your order has been placed successfully!')
@@ -694,7 +557,8 @@ def checkout(request):
     
     context = {
         'cart': cart,
-        'cart_items': cart.items.all(),
+        'cart_items': cart.items.select_related('product'),
+        'cart_subtotal': cart.total(),
         'profile': profile,
     }
     
@@ -895,57 +759,32 @@ def search_results(request):
     featured = request.GET.get('featured', '')
     sort_by = request.GET.get('sort', 'relevance')
     
-    # Start with base queryset
-    if query:
-        products = Product.objects.filter(
-            Q(name__icontains=query) | 
-            Q(description__icontains=query) |
-            Q(category__name__icontains=query)
-        )
-    else:
-        products = Product.objects.all()
-    
-    # Apply filters
-    if selected_category:
-        products = products.filter(category__slug=selected_category)
-    
-    if min_price:
-        try:
-            products = products.filter(price__gte=float(min_price))
-        except ValueError:
-            pass
+    # Ordered ids of the requested page and the facet counts, usually cached
+    started = time.perf_counter()
+    params = parse_search_params(request.GET)
+    result = get_search_page(params)
     
-    if max_price:
-        try:
-            products = products.filter(price__lte=float(max_price))
-        except ValueError:
-            pass
-    
-    if in_stock == 'true':
-        products = products.filter(stock__gt=0)
-    
-    if featured == 'true':
-        products = products.filter(is_featured=True)
-    
-    # Apply sorting
-    if sort_by == 'price_asc':
-        products = products.order_by('price')
-    elif sort_by == 'price_desc':
-        products = products.order_by('-price')
-    elif sort_by == 'newest':
-        products = products.order_by('-created_at')
-    elif sort_by == 'popularity':
-        # This is a placeholder for popularity - in a real app you might use
-        # order count or views as a measure of popularity
-        products = products.order_by('-is_featured', '-created_at')
+    products_by_id = Product.objects.for_cards().in_bulk(result['ids'])
+    products = [products_by_id[product_id] for product_id in result['ids'] if product_id in products_by_id]
+    log_search(params, result['counts']['total'], time.perf_counter() - started, fuzzy=result['fuzzy'])
     
     # Get all categories for filter sidebar
     categories = Category.objects.all()
+    facets = search_facets(result['counts'], categories, params['min_price'], params['max_price'])
+    
+    paginator = Paginator(range(facets['total']), SEARCH_RESULTS_PER_PAGE)
+    page_obj = paginator.get_page(result['page'])
+    page_params = request.GET.copy()
+    page_params.pop('page', None)
     
     context = {
         'query': query,
         'products': products,
+        'page_obj': page_obj,
+        'page_query': page_params.urlencode(),
         'categories': categories,
+        'facets': facets,
+        'fuzzy': result['fuzzy'],
         'selected_category': selected_category,
         'min_price': min_price,
         'max_price': max_price,
@@ -956,6 +795,22 @@ def search_results(request):
     
     return render(request, 'store/search_results.html', context)
 
+def search_suggest(request):
+    """Typeahead completions for the search box, cheap enough to call on every keystroke"""
+    limit, window = SUGGEST_RATE_LIMIT
+    if is_rate_limited(request, 'search_suggest', limit, window):
+        response = JsonResponse({'error': 'Too many requests, slow down'}, status=429)
+        response['Retry-After'] = str(window)
+        return response
+    
+    query = request.GET.get('q', '').strip()
+    response = JsonResponse({
+        'query': query,
+        'suggestions': get_suggestions(query),
+    })
+    patch_cache_control(response, public=True, max_age=SUGGEST_MAX_AGE)
+    return response
+
 # Admin views
 @staff_member_required
 def toggle_staff(request, user_id):
@@ -978,28 +833,74 @@ def delete_user(request, user_id):
 
 @staff_member_required
 def report_page(request):
-    # Generate some reports
-    total_products = Product.objects.count()
-    total_categories = Category.objects.count()
-    total_orders = Order.objects.count()
-    total_users = User.objects.count()
+    # Reports default to the last 12 months, sales figures come from the daily rollup
+    try:
+        end_date = parse_date(request.GET.get('end_date', '')) or timezone.localdate()
+        start_date = parse_date(request.GET.get('start_date', '')) or end_date - timezone.timedelta(days=365)
+    except ValueError:
+        end_date = timezone.localdate()
+        start_date = end_date - timezone.timedelta(days=365)
     
-    # Sales by category
-    categories = Category.objects.annotate(product_count=Count('products'))
+    start_at, end_at = day_bounds(start_date, end_date + timezone.timedelta(days=1))
     
-    context = {
-        'total_products': total_products,
-        'total_categories': total_categories,
-        'total_orders': total_orders,
-        'total_users': total_users,
-        'categories': categories,
-    }
+    context = build_report(start_date, end_date)
+    context.update({
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'total_customers': User.objects.filter(date_joined__gte=start_at, date_joined__lt=end_at).count(),
+        'recent_orders': Order.objects.filter(created_at__gte=start_at, created_at__lt=end_at).order_by('-created_at')[:5],
+    })
     
-    return render(request, 'store/report.html', context)
+    return render(request, 'store/report_page.html', context)
+
+@staff_member_required
+def search_report(request):
+    """Most frequent, zero-result and slowest searches, from the search log"""
+    try:
+        end_date = parse_date(request.GET.get('end_date', '')) or timezone.localdate()
+        start_date = parse_date(request.GET.get('start_date', '')) or end_date - timezone.timedelta(days=SEARCH_REPORT_DAYS)
+    except ValueError:
+        end_date = timezone.localdate()
+        start_date = end_date - timezone.timedelta(days=SEARCH_REPORT_DAYS)
+    
+    # Include the searches still waiting in this process's buffer
+    flush_search_log()
+    start_at, end_at = day_bounds(start_date, end_date + timezone.timedelta(days=1))
+    
+    context = build_search_report(start_at, end_at)
+    context.update({
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+    })
+    
+    return render(request, 'store/search_report.html', context)
+
+@staff_member_required
+def export_orders(request):
+    """Stream orders matching the start/end/status filters as CSV or NDJSON"""
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'error': f"Format must be one of: {', '.join(EXPORT_FORMATS)}"}, status=400)
+    
+    try:
+        filters = parse_export_filters(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    content_type = 'application/x-ndjson' if export_format == 'ndjson' else 'text/csv'
+    response = StreamingHttpResponse(
+        export_rows(export_format, export_orders_queryset(**filters)),
+        content_type=content_type,
+    )
+    filename = f"orders-{timezone.localdate():%Y%m%d}.{export_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
 @staff_member_required
 def clear_report(request):
-    # This would clear any cached report data
+    # Drop the cached dashboard charts so they are recomputed on the next visit
+    invalidate_chart_data()
+    messages.success(request, 'Cached report data has been cleared.')
     return redirect('report_page')
 
 @staff_member_required
@@ -1038,18 +939,8 @@ def fake_products_page(request):
 
 def home(request):
     """Home page view with featured products and promotions."""
-    featured_products = Product.objects.filter(is_featured=True)[:8]
-    new_products = Product.objects.filter(is_new_arrival=True)[:8]
-    best_sellers = Product.objects.filter(is_best_seller=True)[:8]
-    on_sale = Product.objects.filter(is_on_sale=True)[:8]
-    categories = Category.objects.all()[:6]
-    
     context = {
-        'featured_products': featured_products,
-        'new_products': new_products,
-        'best_sellers': best_sellers,
-        'on_sale_products': on_sale,
-        'categories': categories,
+        **get_home_page(),
         'page_title': 'Home'
     }
     
@@ -1100,15 +991,16 @@ def add_product_to_category(request, category_slug):
 def category_products(request, category_slug):
     """View all products in a specific category."""
     category = get_object_or_404(Category, slug=category_slug)
-    products = Product.objects.filter(category=category)
+    products = paginate_products(request, Product.objects.for_cards().filter(category=category), f'category:{category.id}')
     
     context = {
         'category': category,
         'products': products,
+        'page_obj': products,
         'page_title': f'{category.name} Products'
     }
     
-    return render(request, 'store/category_products.html', context)
+    return render(request, 'store/category_detail.html', context)
 
 def user_orders(request):
     """View all orders for the current user."""
@@ -1222,10 +1114,12 @@ def newsletter_signup(request):
 
 def new_arrivals(request):
     """View new arrival products."""
-    products = Product.objects.filter(is_new_arrival=True).order_by('-created_at')
+    products = paginate_products(request, Product.objects.for_cards().filter(is_new_arrival=True), 'new_arrivals')
     
     context = {
         'products': products,
+        'new_products': products,
+        'page_obj': products,
         'page_title': 'New Arrivals'
     }
     
@@ -1233,10 +1127,12 @@ def new_arrivals(request):
 
 def featured_products(request):
     """View featured products."""
-    products = Product.objects.filter(is_featured=True)
+    products = paginate_products(request, Product.objects.for_cards().filter(is_featured=True), 'featured')
     
     context = {
         'products': products,
+        'featured_products': products,
+        'page_obj': products,
         'page_title': 'Featured Products'
     }
     
@@ -1244,10 +1140,11 @@ def featured_products(request):
 
 def best_sellers(request):
     """View best-selling products."""
-    products = Product.objects.filter(is_best_seller=True)
+    products = paginate_products(request, Product.objects.for_cards().filter(is_best_seller=True), 'best_sellers')
     
     context = {
         'products': products,
+        'page_obj': products,
         'page_title': 'Best Sellers'
     }
     
@@ -1255,10 +1152,16 @@ def best_sellers(request):
 
 def on_sale_products(request):
     """View products on sale."""
-    products = Product.objects.filter(is_on_sale=True).order_by('-discount_percentage')
+    products = paginate_products(
+        request,
+        Product.objects.for_cards().filter(is_on_sale=True),
+        'on_sale',
+        ordering=('-discount_percentage', '-created_at', '-id'),
+    )
     
     context = {
         'products': products,
+        'page_obj': products,
         'page_title': 'Products on Sale'
     }
     